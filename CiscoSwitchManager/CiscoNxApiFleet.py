@@ -0,0 +1,195 @@
+
+"""
+Module which runs NX-OS API operations across a fleet of cisco switches concurrently
+
+We can create a CiscoNxApiFleet by giving it a list of switch IP addresses
+A CiscoNxApiSession is opened for each switch the first time an operation is run on it and then reused
+
+Operations run on a bounded pool of threads and the per switch results (or exceptions) are yielded as they complete,
+a switch which does not complete within the fleet timeout is reported as timed out so it can not stall the sweep
+
+The timeout of each switch counts from when a worker starts the operation on it, so switches waiting behind slow ones
+get their full timeout, the requests an operation sends are cut off when the timeout runs out so a dead switch
+releases its worker
+"""
+
+import logging
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from CiscoNxApiSession import CiscoNxApiSession, DEFAULT_USER, DEFAUL_PASSWORD, request_time_limit, _monotonic
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_SWITCH_TIMEOUT = 120
+
+# result of an operation on one switch, exception is None if the operation was successful
+FleetResult = namedtuple('FleetResult', ['ip', 'result', 'exception'])
+
+
+class CiscoNxApiFleet(object):
+    """
+    Class for running the same NX-OS API operation on many Cisco switches at once
+    """
+
+    def __init__(self, switch_ips, user=DEFAULT_USER, password=DEFAUL_PASSWORD, max_workers=DEFAULT_MAX_WORKERS,
+                 timeout=DEFAULT_SWITCH_TIMEOUT, session_factory=None):
+        """ Initiator
+
+        switch_ips:      (list)     IP addresses of the switches in the fleet
+        max_workers:     (int)      Maximum number of switches an operation runs on at the same time
+        timeout:         (float)    Seconds an operation may run on one switch (from when a worker starts it)
+                                    before it is reported as timed out, the CiscoNxApiSession requests sent by the
+                                    operation are cut off at the same time
+        session_factory: (function) Called with a switch IP to create its session, defaults to CiscoNxApiSession
+        """
+
+        self._user = user
+        self._password = password
+        self._timeout = timeout
+        self._session_factory = session_factory or self._create_session
+
+        self._switch_ips = list(switch_ips)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def switch_ips(self):
+        """ The IP addresses of the switches in the fleet """
+        return list(self._switch_ips)
+
+    def add_switch(self, switch_ip):
+        """ Adds a switch to the fleet """
+        if switch_ip not in self._switch_ips:
+            self._switch_ips.append(switch_ip)
+
+    def remove_switch(self, switch_ip):
+        """ Removes a switch from the fleet and closes its session """
+        if switch_ip in self._switch_ips:
+            self._switch_ips.remove(switch_ip)
+        self._close_session(switch_ip)
+
+    def get_session(self, switch_ip):
+        """ Returns the session for a switch, the session is opened the first time it is requested """
+        with self._lock:
+            session = self._sessions.get(switch_ip)
+        if session is None:
+            session = self._session_factory(switch_ip)
+            with self._lock:
+                self._sessions[switch_ip] = session
+        return session
+
+    def run(self, operation, *args, **kwargs):
+        """ Runs an operation on every switch in the fleet and yields a FleetResult for each switch as it completes
+
+        operation: (string or function) Name of a CiscoNxApiSession method (i.e. 'show_all_vlans'),
+                                        or a function which is called with the session as its first argument
+        args, kwargs:                   Passed on to the operation
+        """
+
+        # deadline of each switch, set by the worker when it starts the operation
+        deadlines = {}
+        pending = {}
+        for switch_ip in self._switch_ips:
+            future = self._executor.submit(self._run_on_switch, deadlines, switch_ip, operation, args, kwargs)
+            pending[future] = switch_ip
+
+        while pending:
+            done, _ = wait(pending, timeout=self._time_to_next_deadline(deadlines, pending),
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                switch_ip = pending.pop(future)
+                result, exception = future.result()
+                yield FleetResult(switch_ip, result, exception)
+
+            if self._timeout is None:
+                continue
+
+            now = _monotonic()
+            for future, switch_ip in list(pending.items()):
+                deadline = deadlines.get(switch_ip)
+                if deadline is None or now < deadline:
+                    continue
+                log.error("Operation [%s] on switch [%s] timed out after [%s] seconds",
+                          operation, switch_ip, self._timeout)
+                del pending[future]
+                # the session may be left mid request so a new one is opened next time
+                self._forget_session(switch_ip)
+                yield FleetResult(switch_ip, None, FleetTimeoutException(
+                    "Operation on switch [%s] did not complete within [%s] seconds" % (switch_ip, self._timeout)))
+
+    def collect(self, operation, *args, **kwargs):
+        """ Runs an operation on every switch and returns a dictionary of FleetResults keyed by switch IP """
+        return {result.ip: result for result in self.run(operation, *args, **kwargs)}
+
+    def run_show_command(self, cmd):
+        """ Runs a show command on every switch, yields a FleetResult for each switch as it completes """
+        return self.run('run_show_command', cmd)
+
+    def show_batch(self, names=None):
+        """ Runs CiscoNxApiSession.show_batch on every switch, yields a FleetResult for each switch as it completes """
+        return self.run('show_batch', names)
+
+    def run_config_commands(self, cmds):
+        """ Runs a list of configuration commands on every switch, yields a FleetResult for each switch """
+        return self.run('run_config_commands', cmds)
+
+    def close(self):
+        """ Closes the session with every switch and stops the worker threads """
+        for switch_ip in list(self._sessions):
+            self._close_session(switch_ip)
+        self._executor.shutdown(wait=False)
+
+    def _create_session(self, switch_ip):
+        """ Opens a session with a switch using the fleet's credentials """
+        return CiscoNxApiSession(switch_ip, self._user, self._password)
+
+    def _run_on_switch(self, deadlines, switch_ip, operation, args, kwargs):
+        """ Runs an operation on one switch (in a worker thread) and returns (result, exception)
+        The switch's deadline is recorded in deadlines when the operation starts,
+        the requests sent to the switch (including opening its session) are limited to the fleet timeout
+        """
+        if self._timeout is not None:
+            deadlines[switch_ip] = _monotonic() + self._timeout
+        try:
+            with request_time_limit(self._timeout):
+                session = self.get_session(switch_ip)
+                if callable(operation):
+                    return operation(session, *args, **kwargs), None
+                return getattr(session, operation)(*args, **kwargs), None
+        except Exception as err:
+            log.error("Operation [%s] failed on switch [%s] [%s]", operation, switch_ip, err)
+            return None, err
+
+    def _time_to_next_deadline(self, deadlines, pending):
+        """ Returns the seconds until the first running switch times out (None if the fleet has no timeout)
+        If no switch has started yet the fleet timeout is returned so the deadlines are checked again
+        """
+        if self._timeout is None:
+            return None
+        started = [deadlines[switch_ip] for switch_ip in pending.values() if switch_ip in deadlines]
+        return max(min(started) - _monotonic(), 0) if started else self._timeout
+
+    def _forget_session(self, switch_ip):
+        """ Removes a session from the fleet without closing it """
+        with self._lock:
+            return self._sessions.pop(switch_ip, None)
+
+    def _close_session(self, switch_ip):
+        """ Removes a session from the fleet and closes it """
+        session = self._forget_session(switch_ip)
+        if session is not None:
+            try:
+                session.close_session()
+            except Exception as err:
+                log.error("Exception while closing session with switch [%s] [%s]", switch_ip, err)
+
+
+class FleetTimeoutException(Exception):
+    """ Exception to represent an operation which did not complete on a switch in time """
+    pass
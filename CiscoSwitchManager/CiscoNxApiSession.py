@@ -5,38 +5,304 @@ module assumes that the Cisco switch as the NX API feature enabled
 
 We can create a CiscoNxApiSession by creating a CiscoNxApiSession object
 And giving it the IP address of the switch as an argument
+
+Each CiscoNxApiSession keeps a pool of persistent (keep-alive) HTTPS connections to its switch
+so the TCP and TLS handshakes are only paid once rather than for every command
+
+Several show commands can be sent in a single request with run_show_commands() or show_batch()
+
+Show command results can be cached by giving the session a ShowCommandCache (which can be shared between sessions),
+the cached results for a switch are discarded whenever configuration commands are run on it
+
+Configuration from many helpers can be sent as one batch and saved once with a configuration transaction
+
+with session.configuration_transaction():
+    for interface in interfaces:
+        session.set_interface_down(interface)
 """
 
 import json
 import logging
 import requests
+import threading
+import time
 import urllib3
 
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 log = logging.getLogger(__name__)
 urllib3.disable_warnings()
 
 DEFAULT_USER = 'admin'
 DEFAUL_PASSWORD = 'admin'
 
+DEFAULT_POOL_SIZE = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+DEFAULT_CACHE_TTL = 5
+DEFAULT_CACHE_SIZE = 1024
+
+LOGIN_NODE = "api/aaaLogin.json"
+
+# NX-API rejects cli_show requests with more than 10 commands
+MAX_SHOW_COMMANDS_PER_REQUEST = 10
+
+# cache expiry and request deadlines use time.monotonic where it exists (python 3) so they survive clock changes
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# deadline set by request_time_limit() for the requests sent by each thread
+_request_deadline = threading.local()
+
+
+def _parse_body(body):
+    """ Returns the body of a show command unchanged """
+    return body
+
+
+def _parse_config(body):
+    """ Returns the configuration from the body of a show running-config/startup-config command """
+    return body['nf:filter']['m:configure']['m:terminal']
+
+
+def _parse_ip4_routes(body):
+    """ Returns a dictionary of routes keyed by prefix from the body of a show ip route command """
+    routes = body['TABLE_vrf']['ROW_vrf']['TABLE_addrf']['ROW_addrf']['TABLE_prefix']['ROW_prefix']
+    return {route['ipprefix']: route for route in routes}
+
+
+def _parse_interfaces(body):
+    """ Returns a dictionary of interfaces keyed by name from the body of a show interface brief command """
+    return {interface['interface']: interface for interface in body['TABLE_interface']['ROW_interface']}
+
+
+def _parse_vlans(body):
+    """ Returns a dictionary of VLANs keyed by id from the body of a show vlan brief command """
+    return {vlan['vlanshowbr-vlanid']: vlan for vlan in body['TABLE_vlanbriefxbrief']['ROW_vlanbriefxbrief']}
+
+
+def _parse_vpcs(body):
+    """ Returns a dictionary of VPCs keyed by ifindex from the body of a show vpc brief command """
+    return {vpc['vpc-ifindex']: vpc for vpc in body['TABLE_vpc']['ROW_vpc']}
+
+
+# The show commands which can be run together by show_batch(), with the function which parses each command's body
+BATCH_SHOW_COMMANDS = {'system_config': ("show version", _parse_body),
+                       'running_config': ("show running-config", _parse_config),
+                       'startup_config': ("show startup-config", _parse_config),
+                       'ip4_routing_info': ("show ip route", _parse_ip4_routes),
+                       'all_interfaces': ("show interface brief", _parse_interfaces),
+                       'all_vlans': ("show vlan brief", _parse_vlans),
+                       'all_vpcs': ("show vpc brief", _parse_vpcs)}
+
+
+@contextmanager
+def request_time_limit(seconds):
+    """
+    Requests sent by the calling thread inside the with block must complete within seconds in total,
+    the timeout of each request is cut to the time remaining and CiscoApiTimeoutException is raised once it has run out
+    Limits can be nested (the earliest deadline applies), a limit of None does not limit the requests
+    """
+    previous = getattr(_request_deadline, 'time', None)
+    if seconds is not None:
+        deadline = _monotonic() + seconds
+        _request_deadline.time = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _request_deadline.time = previous
+
+
+def _limit_timeout(timeout):
+    """ Returns the timeout for a request cut to the time remaining under request_time_limit() """
+    deadline = getattr(_request_deadline, 'time', None)
+    if deadline is None:
+        return timeout
+    remaining = deadline - _monotonic()
+    if remaining <= 0:
+        raise CiscoApiTimeoutException("Request time limit exceeded")
+    return min(timeout, remaining)
+
+
+def create_http_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+    """ Returns a requests session which keeps up to pool_size connections to the switch open for reuse
+
+    Failed connection attempts and busy (503) responses are retried with exponential backoff,
+    a request is never resent once the switch may have started executing it: read errors are not retried and
+    neither are 502/504 responses (NX-API returns 504 while a long command such as copy running-config is still running)
+    """
+    retry_options = dict(total=retries, connect=retries, read=0, status=retries, backoff_factor=backoff_factor,
+                         status_forcelist=(503,), raise_on_status=False)
+    try:
+        retry = Retry(allowed_methods=None, **retry_options)
+    except TypeError:
+        # urllib3 versions older than 1.26
+        retry = Retry(method_whitelist=False, **retry_options)
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Content-Type': 'application/json'})
+    session.verify = False
+    return session
+
+
+class ShowCommandCache(object):
+    """
+    Cache of show command results keyed by (switch IP, command) with a time to live per command
+    The least recently used result is dropped when the cache holds more than max_size results
+    Cached results are shared, callers must not modify them
+    """
+
+    def __init__(self, default_ttl=DEFAULT_CACHE_TTL, ttls=None, max_size=DEFAULT_CACHE_SIZE):
+        """ Initiator
+
+        default_ttl: (float)      Seconds a result is kept for commands not in ttls
+        ttls:        (dictionary) Seconds a result is kept for specific commands (0 to never cache the command)
+        max_size:    (int)        The maximum number of results held in the cache
+        """
+        self._default_ttl = default_ttl
+        self._ttls = dict(ttls) if ttls is not None else {}
+        self._max_size = max_size
+
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def get(self, switch_ip, cmd):
+        """ Returns the cached result of a command on a switch, None if it is not cached or has expired """
+        key = (switch_ip, cmd)
+        with self._lock:
+            entry = self._results.pop(key, None)
+            if entry is None or entry[0] <= _monotonic():
+                return None
+            self._results[key] = entry
+            return entry[1]
+
+    def put(self, switch_ip, cmd, result):
+        """ Caches the result of a command on a switch (unless the command has a ttl of 0 or the cache a max_size of 0) """
+        ttl = self._ttls.get(cmd, self._default_ttl)
+        if ttl <= 0 or self._max_size <= 0:
+            return
+        key = (switch_ip, cmd)
+        with self._lock:
+            self._results.pop(key, None)
+            if len(self._results) >= self._max_size:
+                self._results.popitem(last=False)
+            self._results[key] = (_monotonic() + ttl, result)
+
+    def invalidate(self, switch_ip=None):
+        """ Discards the cached results of a switch, or of every switch if switch_ip is not given """
+        with self._lock:
+            if switch_ip is None:
+                self._results.clear()
+                return
+            for key in [key for key in self._results if key[0] == switch_ip]:
+                del self._results[key]
+
+    def __len__(self):
+        return len(self._results)
+
+
+class ConfigTransaction(object):
+    """
+    Queues the configuration commands run on a session and sends them as one cli_conf request on commit
+    The switch rolls back every command in the batch if any of them fails (NX-API rollback-on-error)
+    Created by CiscoNxApiSession.configuration_transaction(), commits when the with block exits without an exception
+    """
+
+    def __init__(self, session, save=True, timeout=600):
+        """ Initiator
+
+        session: (CiscoNxApiSession) The session the commands are run on
+        save:    (bool)              Save the configuration once the commands are applied,
+                                     save_configuration() calls inside the transaction also cause a single save
+        timeout: (int)               Timeout in seconds for the batched request
+        """
+        self.commands = []
+        self.save_requested = False
+        self._session = session
+        self._save = save
+        self._timeout = timeout
+
+    def __enter__(self):
+        if self._session._transaction is not None:
+            raise CiscoApiException("A configuration transaction is already open on switch [%s]" % self._session.ip)
+        self._session._transaction = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._session._transaction = None
+        if exc_type is not None:
+            log.error("Discarding [%s] queued configuration commands for switch [%s]",
+                      len(self.commands), self._session.ip)
+            return False
+        self.commit()
+
+    def add(self, cmds):
+        """ Queues a list of configuration commands """
+        self.commands.extend(cmds)
+
+    def commit(self):
+        """ Sends the queued commands as one batch (rolled back on failure) and then saves the configuration once
+        Can be called inside the with block, commands run after it are queued for the next commit
+        """
+        commands, self.commands = self.commands, []
+        # the session's commands are only sent rather than queued again while it is not in the transaction
+        transaction, self._session._transaction = self._session._transaction, None
+        try:
+            if commands:
+                log.info("Committing [%s] configuration commands to switch [%s]", len(commands), self._session.ip)
+                self._session.run_config_commands(commands, self._timeout, rollback_on_error=True)
+            if (commands and self._save) or self.save_requested:
+                self.save_requested = False
+                self._session.save_configuration()
+        finally:
+            self._session._transaction = transaction
+
+
 class CiscoNxApiSession(object):
     """
     Class for interacting with the Cisco NX-OS API
     """
 
-    def __init__(self, switch_ip, user=DEFAULT_USER, password=DEFAUL_PASSWORD):
+    def __init__(self, switch_ip, user=DEFAULT_USER, password=DEFAUL_PASSWORD, pool_size=DEFAULT_POOL_SIZE,
+                 retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR, cache=None, base_url=None):
         """ Initiator
 
-        switch_ip: (string) IP address of the switch to connect with
+        switch_ip:      (string)           IP address of the switch to connect with
+        pool_size:      (int)              Maximum number of persistent connections kept open to the switch
+        retries:        (int)              Number of times a failed connection or busy response is retried
+        backoff_factor: (float)            Retries wait backoff_factor * 2^(retry number - 1) seconds
+        cache:          (ShowCommandCache) Cache for show command results, results are not cached if not given
+        base_url:       (string)           URL of the switch API, defaults to https://<switch_ip>:443/
         """
 
         self.ip = switch_ip
         self._user = user
         self._password = password
 
-        self.base_url = 'https://%s:443/' % switch_ip
+        self.base_url = base_url if base_url is not None else 'https://%s:443/' % switch_ip
         self.cookies = {}
+        self.cache = cache
+        self._transaction = None
+        self._http = create_http_session(pool_size, retries, backoff_factor)
         self.open_session()
 
+    @property
+    def user(self):
+        """ The username used to log in to the switch """
+        return self._user
+
+    @property
+    def password(self):
+        """ The password used to log in to the switch """
+        return self._password
+
     def set_user(self, user):
         """ Sets the value to be used as the switch username by the CisciNxApiSession instance """
         self._user = user
@@ -48,7 +314,7 @@ class CiscoNxApiSession(object):
     def open_session(self):
         """ Creates a session with the Cisco switch NX-OS API and saves a cookie for this session """
 
-        node = "api/aaaLogin.json"
+        node = LOGIN_NODE
         payload = {"aaaUser": {"attributes": {"name": self.user,
                                               "pwd": self.password}}}
 
@@ -63,7 +329,7 @@ class CiscoNxApiSession(object):
             raise
 
     def close_session(self):
-        """ Closes a session with the Cisco switch NX-OS API """
+        """ Closes a session with the Cisco switch NX-OS API and the persistent connections to the switch """
 
         node = "api/aaaLogout.json"
         payload = {"aaaUser": {"attributes": {"name": self.user}}}
@@ -75,49 +341,72 @@ class CiscoNxApiSession(object):
             log.error("Exception while closing session with Cisco switch [%s] [%s]", self.ip, err)
             raise
 
-    # FIXME: Change admin and Welcome1 to use get methods
-    def _post(self, node, payload, timeout=60):
+        finally:
+            self.cookies.clear()
+            self._http.close()
+
+    def _post(self, node, payload, timeout=60, check_outputs=True):
         """ Sends a HTTP POST request to the NX-OS API on the switch and returns the response
 
-        node:    ()
-        payload: (Dictionary) Contains the information to be sent in the post request
+        Basic authentication is only sent when there is no session cookie,
+        if the switch rejects an expired cookie (401) the session is re-opened and the request is sent again
+        The timeout is cut to the time remaining if the request is sent inside request_time_limit()
+
+        node:          (string)     The API path the request is sent to (i.e. ins)
+        payload:       (Dictionary) Contains the information to be sent in the post request
+        check_outputs: (bool)       Raise an exception if any of the commands in the request failed
         """
 
         url = self.base_url + node
-        headers = {'Content-Type': 'application/json'}
-        auth = (self.user, self.password)
+        data = json.dumps(payload)
 
         try:
             # send the command to the switch API
-            response = requests.post(url, headers=headers, auth=auth, data=json.dumps(payload),
-                                     verify=False, cookies=self.cookies, timeout=timeout)
+            authenticated = bool(self.cookies)
+            response = self._http.post(url, data=data, cookies=self.cookies, timeout=_limit_timeout(timeout),
+                                       auth=None if authenticated else (self.user, self.password))
+
+            if response.status_code == 401 and authenticated and node != LOGIN_NODE:
+                log.info("Session with switch [%s] expired, logging in again", self.ip)
+                self.cookies.clear()
+                self._http.cookies.clear()
+                self.open_session()
+                response = self._http.post(url, data=data, cookies=self.cookies, timeout=_limit_timeout(timeout),
+                                           auth=(self.user, self.password))
 
             # check if the switch API received the command
             if response.status_code != 200:
                 raise CiscoApiException("Error code [%s] [%s]" %
                                         (response.status_code, response.content.decode("utf-8")))
 
+            result = response.json()
+
             # check if the command was successful
-            if "ins_api" in payload:
+            if "ins_api" in payload and check_outputs:
 
-                sub_responses = response.json()['ins_api']['outputs']['output']
+                sub_responses = result['ins_api']['outputs']['output']
                 if not isinstance(sub_responses, list):
                     sub_responses = [sub_responses]
 
-                for result in sub_responses:
-                    if result['code'] != "200":
+                for sub_response in sub_responses:
+                    if sub_response['code'] != "200":
                         raise CiscoApiException("CLI command failed with error [%s] [%s] (See Logs for details)" %
-                                                (result['code'], result['msg']))
+                                                (sub_response['code'], sub_response['msg']))
 
             # return the result of the command
-            return json.loads(response.text)
+            return result
 
         except Exception:
             log.error("POST Request to switch [%s] failed", self.ip)
             raise
 
     def run_show_command(self, cmd, timeout=60):
-        """ Used to execute a show command on the NX-OX API """
+        """ Used to execute a show command on the NX-OX API, the cached result is returned if there is one """
+
+        if self.cache is not None:
+            result = self.cache.get(self.ip, cmd)
+            if result is not None:
+                return result
 
         node = "ins"
         payload = {"ins_api": {"version": "1.0",
@@ -128,17 +417,80 @@ class CiscoNxApiSession(object):
                                "output_format": "json"}}
 
         try:
-            return self._post(node, payload, timeout)
+            result = self._post(node, payload, timeout)
         except Exception:
             log.error("FAILED COMMAND [%s]", cmd)
             raise
 
-    def run_config_commands(self, cmds, timeout=600):
+        if self.cache is not None:
+            self.cache.put(self.ip, cmd, result)
+        return result
+
+    def run_show_commands(self, cmds, timeout=60):
+        """ Used to execute several show commands with one request per 10 commands on the NX-OX API
+
+        Returns a list with the output of each command in the same order as cmds, each output is a dictionary
+        containing the code and msg of the command and its body if it was successful (code "200")
+        A failed command does not raise an exception so that the outputs of the other commands are still returned
+        Only the commands which are not in the cache are sent to the switch
+
+        cmds: (list) List of show commands
+        """
+
+        outputs = [None] * len(cmds)
+        uncached = []
+        for position, cmd in enumerate(cmds):
+            result = self.cache.get(self.ip, cmd) if self.cache is not None else None
+            if result is not None:
+                outputs[position] = result['ins_api']['outputs']['output']
+            else:
+                uncached.append(position)
+
+        for index in range(0, len(uncached), MAX_SHOW_COMMANDS_PER_REQUEST):
+            positions = uncached[index:index + MAX_SHOW_COMMANDS_PER_REQUEST]
+            chunk = [cmds[position] for position in positions]
+            payload = {"ins_api": {"version": "1.0",
+                                   "type": "cli_show",
+                                   "chunk": "0",
+                                   "sid": "1",
+                                   "input": " ; ".join(chunk),
+                                   "output_format": "json"}}
+
+            try:
+                chunk_outputs = self._post("ins", payload, timeout, check_outputs=False)['ins_api']['outputs']['output']
+            except Exception:
+                log.error("FAILED COMMAND(S) %s", chunk)
+                raise
+
+            if not isinstance(chunk_outputs, list):
+                chunk_outputs = [chunk_outputs]
+            if len(chunk_outputs) != len(chunk):
+                raise CiscoApiException("Expected [%s] outputs for commands %s but received [%s]" %
+                                        (len(chunk), chunk, len(chunk_outputs)))
+
+            for position, cmd, output in zip(positions, chunk, chunk_outputs):
+                if output['code'] != "200":
+                    log.error("FAILED COMMAND [%s] with error [%s] [%s]", cmd, output['code'], output.get('msg'))
+                elif self.cache is not None:
+                    # cache in the same form run_show_command returns
+                    self.cache.put(self.ip, cmd, {'ins_api': {'outputs': {'output': output}}})
+                outputs[position] = output
+
+        return outputs
+
+    def run_config_commands(self, cmds, timeout=600, rollback_on_error=False):
         """ Used to execute a list of commands which will perform some sort of configuration on the switch
+        Any cached show command results for the switch are discarded
+        Inside a configuration transaction the commands are queued (and None is returned) until the transaction commits
 
-        cmds: (list) List of commands which will perform the configuration
+        cmds:              (list) List of commands which will perform the configuration
+        rollback_on_error: (bool) The switch undoes all of the commands if any of them fail
         """
 
+        if self._transaction is not None:
+            self._transaction.add(cmds)
+            return None
+
         node = "ins"
         cmd = " ; ".join(cmds)
         payload = {"ins_api": {"version": "1.0",
@@ -147,24 +499,53 @@ class CiscoNxApiSession(object):
                                "sid": "1",
                                "input": cmd,
                                "output_format": "json"}}
+        if rollback_on_error:
+            payload["ins_api"]["rollback"] = "rollback-on-error"
 
         try:
             return self._post(node, payload, timeout)
         except Exception:
             log.error("FAILED COMMAND(S) %s", cmds)
             raise
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(self.ip)
 
     ##################
     # SHOW COMMANDS
     ##################
 
+    def show_batch(self, names=None):
+        """ Runs several of the show commands below in a single request (i.e. for an inventory sweep)
+
+        Returns a dictionary keyed by name with the same value the matching show_<name> method returns,
+        if a command failed its value is a CiscoApiException describing the failure rather than raising
+
+        names: (list) Names from BATCH_SHOW_COMMANDS (i.e. ['system_config', 'all_vlans']), all of them if not given
+        """
+        names = list(names) if names is not None else sorted(BATCH_SHOW_COMMANDS)
+        outputs = self.run_show_commands([BATCH_SHOW_COMMANDS[name][0] for name in names])
+
+        results = {}
+        for name, output in zip(names, outputs):
+            cmd, parse = BATCH_SHOW_COMMANDS[name]
+            if output['code'] != "200":
+                results[name] = CiscoApiException("CLI command [%s] failed with error [%s] [%s]" %
+                                                  (cmd, output['code'], output.get('msg')))
+                continue
+            try:
+                results[name] = parse(output['body'])
+            except (KeyError, TypeError) as err:
+                results[name] = CiscoApiException("Unexpected output for CLI command [%s] [%s]" % (cmd, err))
+        return results
+
     def show_system_config(self):
         """ Returns a dictionary containing information about the systems configuration
 
         (cli cmd: show version)
         """
         result = self.run_show_command("show version")
-        return result['ins_api']['outputs']['output']['body']
+        return _parse_body(result['ins_api']['outputs']['output']['body'])
 
     def show_running_config(self):
         """ Returns a dictionary containing information about the current running configuration
@@ -172,7 +553,7 @@ class CiscoNxApiSession(object):
         (cli cmd: show running-config)
         """
         result = self.run_show_command("show running-config")
-        return result['ins_api']['outputs']['output']['body']['nf:filter']['m:configure']['m:terminal']
+        return _parse_config(result['ins_api']['outputs']['output']['body'])
 
     def show_startup_config(self):
         """ Returns a dictionary containing information about the current startup configuration
@@ -180,7 +561,7 @@ class CiscoNxApiSession(object):
         (cli cmd: show startup-config)
         """
         result = self.run_show_command("show startup-config")
-        return result['ins_api']['outputs']['output']['body']['nf:filter']['m:configure']['m:terminal']
+        return _parse_config(result['ins_api']['outputs']['output']['body'])
 
     def show_ip4_routing_info(self):
         """ Returns a dictionary containing information about IPv4 routing on the switch
@@ -188,9 +569,7 @@ class CiscoNxApiSession(object):
         (cli cmd: show ip route)
         """
         result = self.run_show_command("show ip route")
-        result = result['ins_api']['outputs']['output']['body']['TABLE_vrf']
-        routes = result['ROW_vrf']['TABLE_addrf']['ROW_addrf']['TABLE_prefix']['ROW_prefix']
-        return {route['ipprefix']: route for route in routes}
+        return _parse_ip4_routes(result['ins_api']['outputs']['output']['body'])
 
     def show_interface(self, interface):
         """ Returns a dictionary with detailed information about the specified interface
@@ -207,8 +586,7 @@ class CiscoNxApiSession(object):
         (cli cmd: show interface brief)
         """
         result = self.run_show_command("show interface brief")
-        interfaces = result['ins_api']['outputs']['output']['body']['TABLE_interface']['ROW_interface']
-        return {interface['interface']: interface for interface in interfaces}
+        return _parse_interfaces(result['ins_api']['outputs']['output']['body'])
 
     def show_all_vlans(self):
         """ Returns a dictionary of all the VLANs on the switch and the interfaces on those VLANs
@@ -216,8 +594,7 @@ class CiscoNxApiSession(object):
         (cli cmd: show vlan brief)
         """
         result = self.run_show_command("show vlan brief")
-        vlans = result['ins_api']['outputs']['output']['body']['TABLE_vlanbriefxbrief']['ROW_vlanbriefxbrief']
-        return {vlan['vlanshowbr-vlanid']: vlan for vlan in vlans}
+        return _parse_vlans(result['ins_api']['outputs']['output']['body'])
 
     def show_all_vpcs(self):
         """ Returns a dictionary of all the VPCs configured on the switch
@@ -225,15 +602,31 @@ class CiscoNxApiSession(object):
         (cli cmd: show vpc brief)
         """
         result = self.run_show_command("show vpc brief")
-        vpcs = result['ins_api']['outputs']['output']['body']['TABLE_vpc']['ROW_vpc']
-        return {vpc['vpc-ifindex']: vpc for vpc in vpcs}
+        return _parse_vpcs(result['ins_api']['outputs']['output']['body'])
 
     ##################
     # CONFIGURATION COMMANDS
     ##################
 
+    def configuration_transaction(self, save=True, timeout=600):
+        """ Returns a ConfigTransaction to be used in a with block
+
+        Configuration commands run inside the with block (including by the set_* helpers) are queued,
+        when the block exits they are sent as one batch which the switch rolls back if any command fails
+        and the configuration is saved once, nothing is sent if the block raises an exception
+
+        save: (bool) Save the configuration once the commands are applied
+        """
+        return ConfigTransaction(self, save, timeout)
+
     def save_configuration(self):
-        """ Runs a copy running-config startup-config command so that configuration changes persist """
+        """ Runs a copy running-config startup-config command so that configuration changes persist
+        Inside a configuration transaction the save is deferred until the transaction commits
+        """
+
+        if self._transaction is not None:
+            self._transaction.save_requested = True
+            return
 
         cmds = ["copy running-config startup-config"]
         self.run_config_commands(cmds)
@@ -262,3 +655,8 @@ class CiscoNxApiSession(object):
 class CiscoApiException(Exception):
     """ Exception to represent a failed command on the Cisco API """
     pass
+
+
+class CiscoApiTimeoutException(CiscoApiException):
+    """ Exception to represent a request which could not be sent before the request time limit ran out """
+    pass
@@ -0,0 +1,203 @@
+"""
+Tests for CiscoNxApiFleet, each switch is a mock NX-API HTTP server running in the test process
+
+python -m unittest test_CiscoNxApiFleet
+"""
+
+import json
+import threading
+import time
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from CiscoNxApiFleet import CiscoNxApiFleet, FleetTimeoutException
+from CiscoNxApiSession import CiscoApiException, CiscoNxApiSession
+
+
+class MockSwitchServer(ThreadingMixIn, HTTPServer):
+    """
+    Mock NX-API switch which answers logins and commands,
+    requests wait delay seconds before they are answered and the commands in failing_cmds fail
+    The commands in bodies are answered with the given body, the body of other commands echoes the command
+    The last missing_outputs outputs of each command request are left out of the response
+    The next command requests are answered with the HTTP status codes queued in status_codes,
+    after expire_session() requests with the session cookie of the last login get a 401
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0, failing_cmds=(), bodies=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), MockSwitchHandler)
+        self.delay = delay
+        self.failing_cmds = set(failing_cmds)
+        self.bodies = dict(bodies) if bodies is not None else {}
+        self.missing_outputs = 0
+        # (type, input) of each command request received
+        self.requests = []
+        self.status_codes = []
+        self.logins = 0
+        self.token = None
+        self.stopped = threading.Event()
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server_address[1]
+
+    def expire_session(self):
+        self.token = None
+
+    def stop(self):
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+class MockSwitchHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        # a hung switch does not answer, stopping the server lets the handler finish
+        self.server.stopped.wait(self.server.delay)
+
+        if self.path == '/api/aaaLogin.json':
+            self.server.logins += 1
+            self.server.token = 'token-%d' % self.server.logins
+            return self._reply({'imdata': [{'aaaLogin': {'attributes': {'token': self.server.token}}}]})
+
+        self.server.requests.append((payload['ins_api']['type'], payload['ins_api']['input']))
+        cookie = self.headers.get('Cookie')
+        if cookie is not None and cookie != 'APIC-Cookie=%s' % self.server.token:
+            return self._reply({'imdata': [{'error': {'attributes': {'text': 'Token was invalid'}}}]}, 401)
+        if self.server.status_codes:
+            return self._reply({'error': 'status'}, self.server.status_codes.pop(0))
+        # like NX-API a request with several commands gets a list of outputs, a request with one gets a single output
+        outputs = [self._run_cmd(cmd) for cmd in payload['ins_api']['input'].split(' ; ')]
+        outputs = outputs[:len(outputs) - self.server.missing_outputs]
+        self._reply({'ins_api': {'outputs': {'output': outputs[0] if len(outputs) == 1 else outputs}}})
+
+    def _run_cmd(self, cmd):
+        """ Returns the output of one command, unless it is in bodies the body echoes the command and the port of the switch """
+        if cmd in self.server.failing_cmds:
+            return {'code': '400', 'msg': 'Invalid command', 'input': cmd}
+        body = self.server.bodies.get(cmd, {'cmd': cmd, 'port': self.server.server_address[1]})
+        return {'code': '200', 'msg': 'Success', 'input': cmd, 'body': body}
+
+    def _reply(self, result, status_code=200):
+        body = json.dumps(result).encode('utf-8')
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (IOError, OSError):
+            # the client gave up waiting
+            pass
+
+
+def show_version(session):
+    """ Fleet operation which returns the body of show version """
+    return session.run_show_command('show version')['ins_api']['outputs']['output']['body']
+
+
+class CiscoNxApiFleetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.switches = {}
+        self.fleets = []
+
+    def tearDown(self):
+        for fleet in self.fleets:
+            fleet._executor.shutdown(wait=False)
+        for switch in self.switches.values():
+            switch.stop()
+
+    def _create_fleet(self, switches, **kwargs):
+        """ Starts a mock switch for each name and returns a fleet of them, switches is a dictionary of name: options """
+        for name, options in switches.items():
+            self.switches[name] = MockSwitchServer(**options)
+        fleet = CiscoNxApiFleet(sorted(switches), session_factory=self._create_session, **kwargs)
+        self.fleets.append(fleet)
+        return fleet
+
+    def _create_session(self, name):
+        return CiscoNxApiSession(name, retries=0, base_url=self.switches[name].url)
+
+    def test_results_streamed_as_completed(self):
+        """ Results are yielded in the order the switches answer, not the order of the fleet """
+        fleet = self._create_fleet({'a_slow': {'delay': 0.6}, 'b_medium': {'delay': 0.3}, 'c_fast': {}}, max_workers=3)
+
+        results = list(fleet.run(show_version))
+        self.assertEqual([result.ip for result in results], ['c_fast', 'b_medium', 'a_slow'])
+        for result in results:
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.result['cmd'], 'show version')
+            self.assertEqual(result.result['port'], self.switches[result.ip].server_address[1])
+
+    def test_switch_error_reported_in_its_result(self):
+        """ A failed operation on one switch is returned in its result, the other switches are not affected """
+        fleet = self._create_fleet({'good': {}, 'bad': {'failing_cmds': ['show version']}})
+
+        results = dict((result.ip, result) for result in fleet.run(show_version))
+        self.assertIsInstance(results['bad'].exception, CiscoApiException)
+        self.assertIsNone(results['bad'].result)
+        self.assertIsNone(results['good'].exception)
+        self.assertEqual(results['good'].result['cmd'], 'show version')
+
+    def test_hung_switches_time_out_and_release_workers(self):
+        """
+        Switches which do not answer time out after the fleet timeout, counted from when a worker starts them,
+        the requests to them are cut off so the healthy switches queued behind them still run
+        """
+        fleet = self._create_fleet({'a_hung': {'delay': 6}, 'b_hung': {'delay': 6}, 'c_good': {}, 'd_good': {}},
+                                   max_workers=2, timeout=1)
+
+        start = time.time()
+        results = dict((result.ip, (result, time.time() - start)) for result in fleet.run(show_version))
+        for name in ('a_hung', 'b_hung'):
+            result, elapsed = results[name]
+            self.assertIsInstance(result.exception, (FleetTimeoutException, CiscoApiException))
+            self.assertLess(elapsed, 2)
+        for name in ('c_good', 'd_good'):
+            result, elapsed = results[name]
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.result['cmd'], 'show version')
+        self.assertLess(time.time() - start, 2)
+
+        # the workers were released so the next run is not stuck behind the hung switches
+        fleet.remove_switch('a_hung')
+        fleet.remove_switch('b_hung')
+        start = time.time()
+        results = list(fleet.run(show_version))
+        self.assertEqual(sorted(result.ip for result in results), ['c_good', 'd_good'])
+        self.assertTrue(all(result.exception is None for result in results))
+        self.assertLess(time.time() - start, 1)
+
+
+    def test_queued_switches_get_their_own_timeout(self):
+        """ Healthy switches waiting for a free worker are not timed out by the time spent behind other switches """
+        fleet = self._create_fleet(dict(('switch_%02d' % i, {'delay': 0.1}) for i in range(20)),
+                                   max_workers=2, timeout=1.5)
+
+        results = list(fleet.run(show_version))
+        self.assertEqual(len(results), 20)
+        self.assertEqual([result.exception for result in results], [None] * 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+"""
+Tests for CiscoNxApiSession against the mock NX-API switch of test_CiscoNxApiFleet
+
+python -m unittest test_CiscoNxApiSession
+"""
+
+import unittest
+
+from unittest import mock
+
+from CiscoNxApiSession import CiscoApiException, CiscoNxApiSession, ShowCommandCache
+from test_CiscoNxApiFleet import MockSwitchServer
+
+SAVE_COMMAND = ('cli_conf', 'copy running-config startup-config')
+
+
+class ConfigTransactionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.switch = MockSwitchServer()
+        self.session = CiscoNxApiSession('switch', retries=0, base_url=self.switch.url)
+
+    def tearDown(self):
+        self.switch.stop()
+
+    def test_commands_sent_as_one_batch_on_exit(self):
+        """ Commands and saves inside the with block are sent as one batch followed by one save """
+        with self.session.configuration_transaction():
+            self.session.set_interface_up('Ethernet1/1')
+            self.session.save_configuration()
+            self.session.set_interface_down('Ethernet1/2')
+            self.assertEqual(self.switch.requests, [])
+
+        self.assertEqual(len(self.switch.requests), 2)
+        self.assertIn('interface Ethernet1/1', self.switch.requests[0][1])
+        self.assertIn('interface Ethernet1/2', self.switch.requests[0][1])
+        self.assertEqual(self.switch.requests[1], SAVE_COMMAND)
+
+    def test_commit_inside_block(self):
+        """ commit() inside the with block sends the queued commands, later commands are sent when the block exits """
+        with self.session.configuration_transaction() as transaction:
+            self.session.set_interface_up('Ethernet1/1')
+            transaction.commit()
+            self.assertEqual(len(self.switch.requests), 2)
+            self.assertIn('interface Ethernet1/1', self.switch.requests[0][1])
+            self.assertEqual(self.switch.requests[1], SAVE_COMMAND)
+
+            self.session.set_interface_down('Ethernet1/2')
+            self.assertEqual(len(self.switch.requests), 2)
+
+        self.assertEqual(len(self.switch.requests), 4)
+        self.assertIn('interface Ethernet1/2', self.switch.requests[2][1])
+        self.assertEqual(self.switch.requests[3], SAVE_COMMAND)
+
+    def test_nothing_sent_when_block_raises(self):
+        """ Queued commands are discarded if the with block raises an exception """
+        with self.assertRaises(ValueError):
+            with self.session.configuration_transaction():
+                self.session.set_interface_up('Ethernet1/1')
+                raise ValueError()
+        self.assertEqual(self.switch.requests, [])
+        self.assertIsNone(self.session._transaction)
+
+
+class PostTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.switch = MockSwitchServer()
+        self.session = CiscoNxApiSession('switch', retries=2, backoff_factor=0, base_url=self.switch.url)
+
+    def tearDown(self):
+        self.switch.stop()
+
+    def test_expired_cookie_logs_in_again(self):
+        """ A request rejected because the session expired is sent once more after logging in again """
+        self.switch.expire_session()
+        result = self.session.run_show_command('show version')
+
+        self.assertEqual(result['ins_api']['outputs']['output']['body']['cmd'], 'show version')
+        self.assertEqual(self.switch.logins, 2)
+        self.assertEqual(self.switch.requests, [('cli_show', 'show version')] * 2)
+        self.assertEqual(self.session.cookies['APIC-Cookie'], 'token-2')
+
+    def test_config_not_resent_after_gateway_errors(self):
+        """ The switch may already be running configuration which got a 502 or 504 so it is not sent again """
+        for status_code in (502, 504):
+            self.switch.requests = []
+            self.switch.status_codes = [status_code]
+            with self.assertRaises(CiscoApiException):
+                self.session.run_config_commands(['interface Ethernet1/1', 'no shutdown'])
+            self.assertEqual(len(self.switch.requests), 1)
+
+    def test_busy_switch_retried(self):
+        """ A busy (503) response is retried up to the number of retries """
+        self.switch.status_codes = [503, 503]
+        result = self.session.run_show_command('show version')
+        self.assertEqual(result['ins_api']['outputs']['output']['body']['cmd'], 'show version')
+        self.assertEqual(len(self.switch.requests), 3)
+
+        self.switch.status_codes = [503, 503, 503]
+        with self.assertRaises(CiscoApiException):
+            self.session.run_show_command('show vlan')
+
+
+class ShowCommandsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.switch = MockSwitchServer(failing_cmds=['show cmd 12', 'show vlan brief'], bodies={'show interface brief': {
+            'TABLE_interface': {'ROW_interface': [{'interface': 'Ethernet1/1', 'state': 'up'}]}}})
+        self.session = CiscoNxApiSession('switch', retries=0, base_url=self.switch.url)
+
+    def tearDown(self):
+        self.switch.stop()
+
+    def test_commands_sent_in_chunks_of_ten(self):
+        """ Commands are sent 10 per request and the outputs returned in order, a failed command does not raise """
+        cmds = ['show cmd %02d' % i for i in range(23)]
+        outputs = self.session.run_show_commands(cmds)
+
+        self.assertEqual([len(cmd_input.split(' ; ')) for _, cmd_input in self.switch.requests], [10, 10, 3])
+        self.assertEqual([output['input'] for output in outputs], cmds)
+        self.assertEqual(outputs[12]['code'], '400')
+        self.assertEqual([output['body']['cmd'] for position, output in enumerate(outputs) if position != 12],
+                         [cmd for position, cmd in enumerate(cmds) if position != 12])
+
+    def test_output_count_mismatch_raises(self):
+        self.switch.missing_outputs = 1
+        with self.assertRaises(CiscoApiException):
+            self.session.run_show_commands(['show version', 'show vlan'])
+
+    def test_show_batch_reports_failures_per_command(self):
+        """ Commands which fail or return unexpected output get a CiscoApiException, the others are parsed """
+        results = self.session.show_batch(['system_config', 'all_interfaces', 'all_vlans', 'running_config'])
+
+        self.assertEqual(self.switch.requests, [('cli_show', 'show version ; show interface brief ; show vlan brief ; '
+                                                             'show running-config')])
+        self.assertEqual(results['system_config']['cmd'], 'show version')
+        self.assertEqual(results['all_interfaces'], {'Ethernet1/1': {'interface': 'Ethernet1/1', 'state': 'up'}})
+        self.assertIsInstance(results['all_vlans'], CiscoApiException)
+        self.assertIn('show vlan brief', str(results['all_vlans']))
+        self.assertIsInstance(results['running_config'], CiscoApiException)
+
+
+class ShowCommandCacheTestCase(unittest.TestCase):
+
+    def test_results_expire_after_ttl(self):
+        """ Results are kept for the ttl of their command, commands with a ttl of 0 are never cached """
+        cache = ShowCommandCache(default_ttl=5, ttls={'show clock': 0, 'show inventory': 60})
+        with mock.patch('CiscoNxApiSession._monotonic', return_value=100):
+            cache.put('switch', 'show version', 'version')
+            cache.put('switch', 'show inventory', 'inventory')
+            cache.put('switch', 'show clock', 'clock')
+            self.assertEqual(cache.get('switch', 'show version'), 'version')
+            self.assertIsNone(cache.get('switch', 'show clock'))
+
+        with mock.patch('CiscoNxApiSession._monotonic', return_value=106):
+            self.assertIsNone(cache.get('switch', 'show version'))
+            self.assertEqual(cache.get('switch', 'show inventory'), 'inventory')
+
+    def test_least_recently_used_result_dropped(self):
+        cache = ShowCommandCache(max_size=2)
+        cache.put('switch', 'show version', 'version')
+        cache.put('switch', 'show vlan', 'vlan')
+        cache.get('switch', 'show version')
+        cache.put('switch', 'show interface brief', 'interfaces')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('switch', 'show vlan'))
+        self.assertEqual(cache.get('switch', 'show version'), 'version')
+        self.assertEqual(cache.get('switch', 'show interface brief'), 'interfaces')
+
+    def test_zero_size_cache_stores_nothing(self):
+        cache = ShowCommandCache(max_size=0)
+        cache.put('switch', 'show version', 'version')
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('switch', 'show version'))
+
+
+class CachedSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.switch = MockSwitchServer()
+        self.cache = ShowCommandCache()
+        self.session = CiscoNxApiSession('switch', retries=0, cache=self.cache, base_url=self.switch.url)
+
+    def tearDown(self):
+        self.switch.stop()
+
+    def test_config_commands_invalidate_switch_results(self):
+        """ Running configuration commands on a switch discards its cached results but not those of other switches """
+        self.cache.put('other_switch', 'show version', 'version')
+        self.session.run_show_command('show version')
+        self.session.run_show_command('show version')
+        self.assertEqual(len(self.switch.requests), 1)
+
+        self.session.run_config_commands(['interface Ethernet1/1', 'no shutdown'])
+        self.session.run_show_command('show version')
+        self.assertEqual(self.switch.requests[-1], ('cli_show', 'show version'))
+        self.assertEqual(len(self.switch.requests), 3)
+        self.assertEqual(self.cache.get('other_switch', 'show version'), 'version')
+
+    def test_show_commands_only_sends_uncached(self):
+        """ Cached commands are answered from the cache, the others are sent together and cached """
+        self.session.run_show_command('show version')
+        outputs = self.session.run_show_commands(['show vlan', 'show version', 'show interface brief'])
+
+        self.assertEqual([output['body']['cmd'] for output in outputs], ['show vlan', 'show version', 'show interface brief'])
+        self.assertEqual(self.switch.requests[1:], [('cli_show', 'show vlan ; show interface brief')])
+
+        self.assertEqual(self.session.run_show_command('show vlan')['ins_api']['outputs']['output'], outputs[0])
+        self.assertEqual(len(self.switch.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
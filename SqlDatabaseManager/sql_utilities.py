@@ -3,30 +3,116 @@
 Utilities for interacting with a local mysql database
 Requires MySQLdb module to be installed
 
+The database engine is provided by a backend object, MySqlBackend is used by default
+SqliteBackend provides the same API on an embedded SQLite engine (databases are files in a directory) and needs no server,
+it can be used for tests and benchmarks or as an in-process cache i.e. DatabaseUtils(backend=SqliteBackend())
+
 Once connection is established you must first choose which sql database you will work with using the select_database() method
 If you wish to work on an other databse you must use the select_database() method again to change databases
 Once a database is selected we can create/delete/query tables as well as add/delete/edit rows
 
 The most useful method is the query function which lets you send SQL commands and returns the results
+
+Large amounts of data should be loaded with add_rows_to_table() (batched executemany inside transactions)
+or load_rows_into_table() (LOAD DATA LOCAL INFILE from a temporary file) rather than add_row_to_table()
+Large results should be read with stream_query() which yields rows (or numpy/pandas chunks) from a server side cursor
+Independent queries can be overlapped with query_async() and gather_queries(), these run on a QueryPool of worker threads
+(concurrent.futures, which needs the futures backport package on python 2)
+
+Row values are bound as parameters (never formatted into the SQL text), the statements for frequently used
+operations are built once per connection and kept in a StatementCache
+
+The selected database and the tables in it are cached so add_row_to_table(), delete_row_from_table() and
+get_num_table_rows() send a single statement. The cache is kept up to date by the methods of this class,
+call clear_metadata_cache() after selecting a database or dropping a table with query()
 """
 
-import MySQLdb
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    import MySQLdb
+    import MySQLdb.cursors
+except ImportError:
+    MySQLdb = None
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_QUERY_CONCURRENCY = 4
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+SQLITE_FILE_EXTENSION = '.sqlite'
+
+
+def open_connection(host='localhost', user='root', password='Welcome1', local_infile=False):
+    """ Returns a connection to the sql database with autocommit enabled """
+    if MySQLdb is None:
+        raise ImportError("MySQLdb module must be installed to connect to a mysql database")
+    db = MySQLdb.connect(host=host, user=user, passwd=password, local_infile=int(local_infile))
+    db.autocommit(True)
+    return db
 
 
 # FIXME: Make private
 def connect_to_database(host='localhost', user='root', password='Welcome1'):
     """ Returns a cursor object for interacting with the sql database """
-    db = MySQLdb.connect(host=host, user=user, passwd=password)
-    db.autocommit(True)
-    return db.cursor()
+    return open_connection(host, user, password).cursor()
+
+
+def batch_rows(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """ Splits an iterable (or generator) of rows into lists of at most batch_size rows """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _convert_batch(batch, column_names, output):
+    """ Converts a list of rows to a numpy structured array or a pandas DataFrame (imported only when needed) """
+    if output == 'numpy':
+        import numpy as np
+        return np.rec.fromrecords(batch, names=column_names)
+    elif output == 'pandas':
+        import pandas as pd
+        return pd.DataFrame.from_records(batch, columns=column_names)
+    return batch
+
+
+def quote_identifier(name):
+    """ Quotes a table or column name so that it can be safely formatted into a statement """
+    return '`%s`' % name.replace('`', '``')
+
+
+def _escape_infile_value(value):
+    """ Converts a value to a field in the default LOAD DATA format (tab separated, backslash escaped) """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        # str() gives 'True' which mysql loads into a numeric column as 0
+        return '1' if value else '0'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif isinstance(value, float):
+        # str() rounds floats to 12 significant digits, repr() keeps every digit
+        value = repr(value)
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
 
 
 # FIXME: Make private
 def confirm_database_selected(func):
     """ warpper function for confirming a database has been selected """
     def wrapper(self, *args, **kwargs):
-        self.db.execute("select database()")
-        if self.db.fetchall()[0][0] == None:
+        if self._get_current_database() is None:
             print "No database has been selected"
             return None
         else:
@@ -38,7 +124,7 @@ def confirm_database_selected(func):
 def confirm_table_exists(func):
     """ Wrapper for confirming a table exists in the selected database """
     def wrapper(self, *args, **kwargs):
-        if args[0] not in self.get_all_tables():
+        if not self._table_exists(args[0]):
             print "Warning: Table [%s] does not exists" % args[0]
             return False
         else:
@@ -46,44 +132,382 @@ def confirm_table_exists(func):
     return wrapper
 
 
+class MySqlBackend(object):
+    """
+    Backend for a mysql server accessed through MySQLdb
+    Owns one connection, clone() returns a backend with a new connection to the same server
+    """
+
+    placeholder = '%s'
+    supports_load_infile = True
+
+    def __init__(self, host='localhost', user='root', password='Welcome1', local_infile=False):
+        """ Initiator
+
+        local_infile: (bool) Must be set to use LOAD DATA LOCAL INFILE
+        """
+        self._login = (host, user, password, local_infile)
+        self.connection = open_connection(host, user, password, local_infile)
+        self.cursor = self.connection.cursor()
+
+    def clone(self):
+        """ Returns a new backend connected to the same server """
+        return MySqlBackend(*self._login)
+
+    def close(self):
+        """ Closes the connection """
+        self.connection.close()
+
+    def begin(self):
+        """ Starts a transaction """
+        self.connection.autocommit(False)
+
+    def commit(self):
+        """ Commits the current transaction and returns to autocommit mode """
+        try:
+            self.connection.commit()
+        finally:
+            self.connection.autocommit(True)
+
+    def rollback(self):
+        """ Rolls back the current transaction and returns to autocommit mode """
+        try:
+            self.connection.rollback()
+        finally:
+            self.connection.autocommit(True)
+
+    def streaming_cursor(self):
+        """ Returns an unbuffered cursor which reads rows from the server as they are fetched """
+        return self.connection.cursor(MySQLdb.cursors.SSCursor)
+
+    def get_all_databases(self):
+        """ Returns a list with the names of all databases """
+        self.cursor.execute("select schema_name as `Database` from information_schema.schemata")
+        return [data[0] for data in self.cursor.fetchall()]
+
+    def get_current_database(self):
+        """ Returns the name of the selected database, None if no database is selected """
+        self.cursor.execute("select database()")
+        return self.cursor.fetchall()[0][0]
+
+    def select_database(self, db_name):
+        """ Selects a database for use """
+        self.cursor.execute("use %s" % quote_identifier(db_name))
+
+    def create_database(self, db_name):
+        """ Creates a database """
+        self.cursor.execute("create database %s" % quote_identifier(db_name))
+
+    def delete_database(self, db_name):
+        """ Deletes a database """
+        self.cursor.execute("drop database %s" % quote_identifier(db_name))
+
+    def get_all_tables(self):
+        """ Returns a list of all the tables in the selected database """
+        self.cursor.execute("show tables")
+        return [data[0] for data in self.cursor.fetchall()]
+
+    def load_infile(self, table_name, column_names, file_name):
+        """ Loads a tab separated file into a table and returns the number of rows added """
+        return self.cursor.execute("load data local infile %%s into table %s (%s)" %
+                                   (quote_identifier(table_name), ','.join(quote_identifier(name) for name in column_names)),
+                                   (file_name,))
+
+
+class SqliteBackend(object):
+    """
+    Backend for an embedded SQLite engine, each database is a file in directory
+    If no directory is given a temporary directory is used which is removed by close()
+    Owns one connection, clone() returns a backend with a new connection to the same directory
+    """
+
+    placeholder = '?'
+    supports_load_infile = False
+
+    def __init__(self, directory=None):
+        """ Initiator
+
+        directory: (string) The directory holding the database files
+        """
+        self._temporary = directory is None
+        self.directory = tempfile.mkdtemp(prefix='sqlite_databases_') if directory is None else directory
+        self._database = None
+        self._open(':memory:')
+
+    def clone(self):
+        """ Returns a new backend using the same directory, the clone never removes the directory """
+        backend = SqliteBackend(self.directory)
+        if self._database is not None:
+            backend.select_database(self._database)
+        return backend
+
+    def close(self):
+        """ Closes the connection and removes the directory if it is temporary """
+        self.connection.close()
+        if self._temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def begin(self):
+        """ Starts a transaction """
+        self.cursor.execute("begin")
+
+    def commit(self):
+        """ Commits the current transaction """
+        self.cursor.execute("commit")
+
+    def rollback(self):
+        """ Rolls back the current transaction """
+        self.cursor.execute("rollback")
+
+    def streaming_cursor(self):
+        """ Returns a new cursor, SQLite cursors only read rows as they are fetched """
+        return self.connection.cursor()
+
+    def get_all_databases(self):
+        """ Returns a list with the names of all databases """
+        return sorted(file_name[:-len(SQLITE_FILE_EXTENSION)] for file_name in os.listdir(self.directory)
+                      if file_name.endswith(SQLITE_FILE_EXTENSION))
+
+    def get_current_database(self):
+        """ Returns the name of the selected database, None if no database is selected """
+        return self._database
+
+    def select_database(self, db_name):
+        """ Selects a database for use """
+        self.connection.close()
+        self._open(self._database_file(db_name))
+        self._database = db_name
+
+    def create_database(self, db_name):
+        """ Creates a database """
+        sqlite3.connect(self._database_file(db_name)).close()
+
+    def delete_database(self, db_name):
+        """ Deletes a database """
+        if db_name == self._database:
+            self.connection.close()
+            self._open(':memory:')
+            self._database = None
+        os.remove(self._database_file(db_name))
+
+    def get_all_tables(self):
+        """ Returns a list of all the tables in the selected database """
+        self.cursor.execute("select name from sqlite_master where type = 'table'")
+        return [data[0] for data in self.cursor.fetchall()]
+
+    def _database_file(self, db_name):
+        """ Returns the path of the file holding a database """
+        return os.path.join(self.directory, db_name + SQLITE_FILE_EXTENSION)
+
+    def _open(self, file_name):
+        """ Opens a connection in autocommit mode, transactions are started explicitly by begin() """
+        # a QueryPool worker's connection is closed by the thread which closes the pool,
+        # the connection is still only used by one thread at a time
+        self.connection = sqlite3.connect(file_name, isolation_level=None, check_same_thread=False)
+        self.cursor = self.connection.cursor()
+
+
+class StatementCache(object):
+    """
+    LRU cache of parameterised statements, each statement is built once and then reused with new parameters
+    The least recently used statement is dropped when the cache holds more than max_size statements
+    """
+
+    def __init__(self, max_size=DEFAULT_STATEMENT_CACHE_SIZE):
+        """ Initiator
+
+        max_size: (int) The maximum number of statements held in the cache
+        """
+        self._max_size = max_size
+        self._statements = OrderedDict()
+
+    def get(self, key, build):
+        """ Returns the statement for key, calls build() to create the statement if it is not in the cache
+
+        key:   (tuple)    Hashable description of the statement (i.e. operation, table name and column names)
+        build: (function) Returns the statement text with %s placeholders for the parameters
+        """
+        try:
+            statement = self._statements.pop(key)
+        except KeyError:
+            statement = build()
+            if self._max_size <= 0:
+                return statement
+            if len(self._statements) >= self._max_size:
+                self._statements.popitem(last=False)
+        self._statements[key] = statement
+        return statement
+
+    def clear(self):
+        """ Removes all statements from the cache """
+        self._statements.clear()
+
+    def __len__(self):
+        return len(self._statements)
+
+
+class QueryPool(object):
+    """
+    Runs queries concurrently on a ThreadPoolExecutor
+    Connections can not be shared between threads so each worker thread opens its own connection by cloning a backend
+    At most max_concurrency queries run at once, the rest wait in the executor's queue
+    """
+
+    def __init__(self, backend, max_concurrency=DEFAULT_QUERY_CONCURRENCY):
+        """ Initiator (each worker thread opens its connection when it runs its first query)
+
+        backend: (MySqlBackend or SqliteBackend) Backend which is cloned to create the connection of each worker
+        """
+        self._backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._local = threading.local()
+        self._worker_backends = []
+        self._lock = threading.Lock()
+
+    def submit(self, cmd, args=None, database=None):
+        """ Queues a query to be run and returns a Future for its rows
+
+        database: (string) The database to be selected before running the query
+        """
+        return self._executor.submit(self._run_query, cmd, args, database)
+
+    def gather(self, cmds, database=None, timeout=None):
+        """ Runs a list of queries concurrently and returns a list of their results in the same order
+        Raises QueryTimeoutException if a query does not complete within timeout seconds
+
+        cmds: (list) Each entry is a query or a (query, args) tuple with the parameters to be bound to the query
+        """
+        futures = [self.submit(cmd, database=database) if isinstance(cmd, basestring) else
+                   self.submit(cmd[0], cmd[1], database) for cmd in cmds]
+        results = []
+        for cmd, future in zip(cmds, futures):
+            try:
+                results.append(future.result(timeout))
+            except TimeoutError:
+                raise QueryTimeoutException("Query [%s] did not complete within [%s] seconds" % (cmd, timeout))
+        return results
+
+    def close(self):
+        """ Stops the workers once the queued queries have completed and closes their connections """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            worker_backends, self._worker_backends = self._worker_backends, []
+        for worker_backend in worker_backends:
+            worker_backend.close()
+
+    def _run_query(self, cmd, args, database):
+        """ Runs a query on the connection of the worker thread it runs on and returns the rows """
+        worker_backend = getattr(self._local, 'backend', None)
+        if worker_backend is None:
+            worker_backend = self._local.backend = self._backend.clone()
+            with self._lock:
+                self._worker_backends.append(worker_backend)
+
+        if database is not None and database != worker_backend.get_current_database():
+            worker_backend.select_database(database)
+        if args is None:
+            worker_backend.cursor.execute(cmd)
+        else:
+            worker_backend.cursor.execute(cmd, args)
+        return worker_backend.cursor.fetchall()
+
+
 class DatabaseUtils():
-    def __init__(self, host='localhost', user='root', password='Welcome1'):
-        """ Initiator for the database utils """
-        self.db = connect_to_database(host, user, password)
+    def __init__(self, host='localhost', user='root', password='Welcome1', local_infile=False, backend=None,
+                 max_concurrency=DEFAULT_QUERY_CONCURRENCY):
+        """ Initiator for the database utils
+
+        local_infile:    (bool)                          Must be set to use load_rows_into_table()
+        backend:         (MySqlBackend or SqliteBackend) The database engine, a MySqlBackend is created if not given
+        max_concurrency: (int)                           Maximum number of queries query_async() runs at once
+        """
+        self._backend = backend if backend is not None else MySqlBackend(host, user, password, local_infile)
+        self._max_concurrency = max_concurrency
+        self._query_pool = None
+        self._statements = StatementCache()
+
+        # the selected database and the tables in it, None until they are read from the backend
+        self._current_database = None
+        self._tables = None
+        self._metadata_loaded = False
+
+    @property
+    def db(self):
+        """ The cursor of the backend connection (changes when a SQLite database is selected) """
+        return self._backend.cursor
+
+    def close(self):
+        """ Stops the query pool and closes the backend connection """
+        self.close_query_pool()
+        self._backend.close()
+
+    @contextmanager
+    def transaction(self):
+        """ Runs the statements in the with block as one transaction, rolls back if an exception is raised """
+        self._backend.begin()
+        try:
+            yield self.db
+        except Exception:
+            self._backend.rollback()
+            raise
+        self._backend.commit()
 
     def get_all_databases(self):
         """ Returns a list with the names of all databases """
-        self.db.execute("select schema_name as `Database` from information_schema.schemata")
-        database_info = self.db.fetchall()
-        return [data[0] for data in database_info]
+        return self._backend.get_all_databases()
+
+    def clear_metadata_cache(self):
+        """ Forgets the cached selected database and tables, they are read from the backend again when next needed """
+        self._current_database = None
+        self._tables = None
+        self._metadata_loaded = False
+
+    def _get_current_database(self):
+        """ Returns the name of the selected database (cached), None if no database is selected """
+        if not self._metadata_loaded:
+            self._current_database = self._backend.get_current_database()
+            self._metadata_loaded = True
+        return self._current_database
+
+    def _table_exists(self, table_name):
+        """ Returns true if a table is in the selected database, only asks the backend if the table is not cached """
+        if self._tables is not None and table_name in self._tables:
+            return True
+        # the table may have been created with query() so the cache is refreshed before reporting it missing
+        return table_name in self.get_all_tables()
 
     def select_database(self, db_name):
         """ selects a database for use """
         if db_name in self.get_all_databases():
-            self.db.execute("use %s" % db_name)
+            self._backend.select_database(db_name)
+            self._current_database = db_name
+            self._tables = None
+            self._metadata_loaded = True
         else:
             print "Warning: Database [%s] dose not exist" % db_name
 
     def create_database(self, db_name):
         """ Creates a database if it doesn't already exist """
         if db_name not in self.get_all_databases():
-            self.db.execute("create database %s" % db_name)
+            self._backend.create_database(db_name)
         else:
             print "Warning: Database [%s] already exists" % db_name
 
     def delete_database(self, db_name):
         """ Delete a database if it exists """
         if db_name in self.get_all_databases():
-            self.db.execute("drop database %s" % db_name)
+            self._backend.delete_database(db_name)
+            if db_name == self._current_database:
+                self.clear_metadata_cache()
         else:
             print "Warning: Database [%s] does not exists, deletion failure" % db_name
 
     @confirm_database_selected
     def get_all_tables(self):
         """ returns a list of all the tables in the selected database """
-        self.db.execute("show tables")
-        database_info = self.db.fetchall()
-        return [data[0] for data in database_info]
+        tables = self._backend.get_all_tables()
+        self._tables = set(tables)
+        return tables
 
     @confirm_database_selected
     def create_table(self, table_name, column_name, column_types):
@@ -99,6 +523,7 @@ class DatabaseUtils():
             return False
         cmd = 'create table %s (' + ','.join([s1 + ' ' + s2 for s1, s2 in zip(column_name, column_types)]) + ')'
         self.db.execute(cmd % table_name)
+        self._tables.add(table_name)
         return True
 
     @confirm_database_selected
@@ -106,34 +531,173 @@ class DatabaseUtils():
     def delete_table(self, table_name):
         """ Deletes a table from the selected database """
         self.db.execute('drop table %s' % table_name)
+        self._tables.discard(table_name)
         return True
 
     @confirm_database_selected
     @confirm_table_exists
     def get_num_table_rows(self, table_name):
         """ Returns the number of rows in a table """
-        self.db.execute('select count(*) from %s' % table_name)
+        cmd = self._statements.get(('count', table_name),
+                                   lambda: 'select count(*) from %s' % quote_identifier(table_name))
+        self.db.execute(cmd)
         return self.db.fetchall()[0][0]
 
     @confirm_database_selected
     @confirm_table_exists
     def add_row_to_table(self, table_name, column_names, column_values):
-        """ Adds a row to a table, data added is in the columns specified by column names """
+        """
+        Adds a row to a table, data added is in the columns specified by column names
+        The values are bound as parameters so they should be python values rather than SQL literals (i.e. 'abc' not "'abc'")
+        """
         if len(column_names) != len(column_values):
             print "Warning: List lenght of column names and column values is not equal"
             return False # replace with raise
-        cmd = 'insert into %s (' + ','.join(column_names) + ')' + ' values (' + ','.join(column_values) + ')'
-        print cmd % table_name
-        self.db.execute(cmd % table_name)
+        self.db.execute(self._insert_statement(table_name, column_names), column_values)
 
     @confirm_database_selected
     @confirm_table_exists
     def delete_row_from_table(self, table_name, column_name, column_value):
         """ Deletes a row from the selected table, deletes all rows with the specified column_value """
-        print 'delete from %s where %s is %s' % (table_name, column_name, column_value)
-        self.db.execute('delete from %s where %s = %s' % (table_name, column_name, column_value))
+        cmd = self._statements.get(('delete', table_name, column_name),
+                                   lambda: 'delete from %s where %s = %s' % (quote_identifier(table_name),
+                                                                             quote_identifier(column_name),
+                                                                             self._backend.placeholder))
+        self.db.execute(cmd, (column_value,))
+
+    def _insert_statement(self, table_name, column_names):
+        """ Returns the cached parameterised insert statement for a table and list of columns """
+        return self._statements.get(('insert', table_name, tuple(column_names)),
+                                    lambda: 'insert into %s (%s) values (%s)' %
+                                            (quote_identifier(table_name),
+                                             ','.join(quote_identifier(name) for name in column_names),
+                                             ','.join([self._backend.placeholder] * len(column_names))))
+
+    @confirm_database_selected
+    @confirm_table_exists
+    def add_rows_to_table(self, table_name, column_names, rows, batch_size=DEFAULT_BATCH_SIZE, atomic=False):
+        """
+        Adds many rows to a table and returns the number of rows added
+
+        Unlike add_row_to_table() the values are passed as parameters (not SQL literals) so strings need no quoting
+        MySQLdb rewrites executemany() on an insert into a single multi-row insert so each batch is one statement
+        (SQLite runs the prepared insert once per row without leaving the process)
+
+        rows:       (iterable) Sequences of values in the same order as column_names, can be a generator
+        batch_size: (int)      Number of rows sent per insert statement
+        atomic:     (bool)     If true all rows are added in one transaction, otherwise each batch is committed
+        """
+        cmd = self._insert_statement(table_name, column_names)
+        num_rows = 0
+
+        if atomic:
+            with self.transaction():
+                for batch in batch_rows(rows, batch_size):
+                    self.db.executemany(cmd, batch)
+                    num_rows += len(batch)
+        else:
+            for batch in batch_rows(rows, batch_size):
+                with self.transaction():
+                    self.db.executemany(cmd, batch)
+                num_rows += len(batch)
+
+        return num_rows
+
+    @confirm_database_selected
+    @confirm_table_exists
+    def load_rows_into_table(self, table_name, column_names, rows):
+        """
+        Adds rows to a table by writing them to a temporary file and using LOAD DATA LOCAL INFILE
+        This is the fastest way to load very large amounts of data, requires the object to be created with local_infile
+        Backends without LOAD DATA (SQLite) add the rows with add_rows_to_table() in one transaction instead
+        Returns the number of rows added
+
+        rows: (iterable) Sequences of values in the same order as column_names, None is loaded as NULL
+        """
+        if not self._backend.supports_load_infile:
+            return self.add_rows_to_table(table_name, column_names, rows, atomic=True)
+
+        fd, file_name = tempfile.mkstemp(suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'wb') as infile:
+                for row in rows:
+                    infile.write('\t'.join(_escape_infile_value(value) for value in row) + '\n')
+
+            with self.transaction():
+                num_rows = self._backend.load_infile(table_name, column_names, file_name)
+        finally:
+            os.remove(file_name)
+
+        return num_rows
 
     def query(self, cmd):
         """ Runs a query command """
         self.db.execute(cmd)
         return self.db.fetchall()
+
+    def query_async(self, cmd, args=None):
+        """
+        Queues a query to be run on a worker thread and returns a Future, call result() on it to get the rows
+        Queries run against the currently selected database, the worker pool is created on first use
+
+        args: (tuple) Parameters to be bound to the backend's placeholders in the command
+        """
+        return self._get_query_pool().submit(cmd, args, self._get_current_database())
+
+    def gather_queries(self, cmds, timeout=None):
+        """ Runs a list of independent queries concurrently and returns a list of their results in the same order
+
+        cmds: (list) Each entry is a query or a (query, args) tuple with the parameters to be bound to the query
+        """
+        return self._get_query_pool().gather(cmds, self._get_current_database(), timeout)
+
+    def _get_query_pool(self):
+        """ Returns the pool used by query_async(), the pool is started the first time it is needed """
+        if self._query_pool is None:
+            self._query_pool = QueryPool(self._backend, self._max_concurrency)
+        return self._query_pool
+
+    def close_query_pool(self):
+        """ Stops the worker threads used by query_async() and closes their connections """
+        if self._query_pool is not None:
+            self._query_pool.close()
+            self._query_pool = None
+
+    def stream_query(self, cmd, args=None, batch_size=None, output='rows'):
+        """
+        Runs a query command and yields the results as they are read from the server (uses an unbuffered SSCursor)
+        The full result is never held in memory, no other commands can be run until the generator is exhausted or closed
+
+        args:       (tuple)  Parameters to be bound to the backend's placeholders in the command (%s for mysql, ? for SQLite)
+        batch_size: (int)    If set lists of up to batch_size rows are yielded instead of single rows
+        output:     (string) 'rows' for tuples, 'numpy' for structured arrays or 'pandas' for DataFrames,
+                             numpy and pandas output is always batched (DEFAULT_BATCH_SIZE rows if batch_size is not set)
+        """
+        if output not in ('rows', 'numpy', 'pandas'):
+            raise ValueError("Invalid output type [%s]" % output)
+        if output != 'rows' and batch_size is None:
+            batch_size = DEFAULT_BATCH_SIZE
+
+        cursor = self._backend.streaming_cursor()
+        try:
+            if args is None:
+                cursor.execute(cmd)
+            else:
+                cursor.execute(cmd, args)
+            if batch_size is None:
+                for row in iter(cursor.fetchone, None):
+                    yield row
+            else:
+                column_names = [description[0] for description in cursor.description]
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    yield _convert_batch(list(batch), column_names, output)
+        finally:
+            cursor.close()
+
+
+class QueryTimeoutException(Exception):
+    """ Exception class for when a query does not complete in time """
+    pass
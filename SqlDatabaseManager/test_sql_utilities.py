@@ -0,0 +1,227 @@
+"""
+Tests for sql_utilities, run against the SQLite backend so no mysql server is needed
+
+python -m unittest test_sql_utilities
+"""
+
+import threading
+import time
+import unittest
+
+from sql_utilities import DatabaseUtils, QueryPool, SqliteBackend, StatementCache
+
+LOAD_COLUMNS = ['id', 'amount', 'enabled', 'note']
+LOAD_ROWS = [(1, 1234567.891234567, True, 'plain'),
+             (2, 0.1, False, 'tab\tnew line\nback\\slash'),
+             (3, -2.5e-10, True, None),
+             (4, None, None, u'unicode \u2013 dash')]
+
+
+def _unescape_infile_value(field):
+    """ Reverses the escaping done by _escape_infile_value (the default LOAD DATA format) """
+    if field == '\\N':
+        return None
+    value = []
+    fields = iter(field)
+    for char in fields:
+        if char == '\\':
+            char = {'t': '\t', 'n': '\n'}.get(next(fields), '\\')
+        value.append(char)
+    return ''.join(value).decode('utf-8')
+
+
+class InfileSqliteBackend(SqliteBackend):
+    """
+    SQLite backend which reads the LOAD DATA file written by load_rows_into_table() the way mysql would
+    and counts the metadata lookups made on it
+    """
+
+    supports_load_infile = True
+
+    def __init__(self, directory=None):
+        SqliteBackend.__init__(self, directory)
+        self.metadata_lookups = 0
+
+    def get_current_database(self):
+        self.metadata_lookups += 1
+        return SqliteBackend.get_current_database(self)
+
+    def get_all_tables(self):
+        self.metadata_lookups += 1
+        return SqliteBackend.get_all_tables(self)
+
+    def load_infile(self, table_name, column_names, file_name):
+        with open(file_name, 'rb') as infile:
+            rows = [[_unescape_infile_value(field) for field in line.rstrip('\n').split('\t')] for line in infile]
+        self.cursor.executemany('insert into %s (%s) values (%s)' % (table_name, ','.join(column_names),
+                                                                    ','.join('?' * len(column_names))), rows)
+        return len(rows)
+
+
+class DatabaseUtilsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = InfileSqliteBackend()
+        self.utils = DatabaseUtils(backend=self.backend)
+        self.utils.create_database('test')
+        self.utils.select_database('test')
+
+    def tearDown(self):
+        self.utils.close()
+
+    def _create_load_table(self, table_name):
+        self.utils.create_table(table_name, LOAD_COLUMNS, ['integer', 'real', 'integer', 'text'])
+
+    def test_load_rows_matches_add_rows(self):
+        """ Rows loaded from the LOAD DATA file are stored exactly as rows inserted with bound parameters """
+        self._create_load_table('inserted')
+        self._create_load_table('loaded')
+
+        self.assertEqual(self.utils.add_rows_to_table('inserted', LOAD_COLUMNS, LOAD_ROWS), len(LOAD_ROWS))
+        self.assertEqual(self.utils.load_rows_into_table('loaded', LOAD_COLUMNS, LOAD_ROWS), len(LOAD_ROWS))
+
+        inserted = self.utils.query('select * from inserted order by id')
+        loaded = self.utils.query('select * from loaded order by id')
+        self.assertEqual(inserted, loaded)
+        self.assertEqual(loaded[0][1], 1234567.891234567)
+        self.assertEqual([row[2] for row in loaded], [1, 0, 1, None])
+
+    def test_gather_queries_binds_args(self):
+        """ Queries given with args are run with the args bound, results are returned in order """
+        self.utils.create_table('numbers', ['value'], ['integer'])
+        self.utils.add_rows_to_table('numbers', ['value'], [(value,) for value in range(10)])
+        self.backend.metadata_lookups = 0
+
+        results = self.utils.gather_queries(['select count(*) from numbers',
+                                             ('select value from numbers where value > ? order by value', (7,)),
+                                             ('select value from numbers where value = ?', (3,))])
+        self.assertEqual(results, [[(10,)], [(8,), (9,)], [(3,)]])
+        self.assertEqual(self.utils.query_async('select value from numbers where value < ?', (1,)).result(5), [(0,)])
+        # the queries run on the cached selected database
+        self.assertEqual(self.backend.metadata_lookups, 0)
+
+    def test_row_operations_use_cached_metadata(self):
+        """ Once the tables are known add/delete/count run without looking up the database or tables again """
+        self.utils.create_table('numbers', ['value'], ['integer'])
+        self.backend.metadata_lookups = 0
+
+        for value in range(5):
+            self.utils.add_row_to_table('numbers', ['value'], [value])
+        self.utils.delete_row_from_table('numbers', 'value', 0)
+        self.assertEqual(self.utils.get_num_table_rows('numbers'), 4)
+        self.assertEqual(self.backend.metadata_lookups, 0)
+
+    def test_metadata_cache_follows_changes(self):
+        """ Tables created with query() are found and dropped tables and databases are forgotten """
+        self.utils.query('create table created_by_query (value integer)')
+        self.assertEqual(self.utils.get_num_table_rows('created_by_query'), 0)
+
+        self.utils.delete_table('created_by_query')
+        self.assertFalse(self.utils.get_num_table_rows('created_by_query'))
+
+        self.utils.delete_database('test')
+        self.assertIsNone(self.utils.get_all_tables())
+
+
+class StreamQueryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.utils = DatabaseUtils(backend=SqliteBackend())
+        self.utils.create_database('test')
+        self.utils.select_database('test')
+        self.utils.create_table('numbers', ['value', 'square'], ['integer', 'integer'])
+        self.utils.add_rows_to_table('numbers', ['value', 'square'], [(value, value * value) for value in range(7)])
+
+    def tearDown(self):
+        self.utils.close()
+
+    def test_rows_streamed_one_at_a_time(self):
+        rows = self.utils.stream_query('select value, square from numbers order by value')
+        self.assertEqual(next(rows), (0, 0))
+        self.assertEqual(list(rows), [(value, value * value) for value in range(1, 7)])
+
+    def test_batches(self):
+        """ Rows are yielded in lists of batch_size rows, the last batch holds the rows left over """
+        batches = list(self.utils.stream_query('select value from numbers order by value', batch_size=3))
+        self.assertEqual(batches, [[(0,), (1,), (2,)], [(3,), (4,), (5,)], [(6,)]])
+
+    def test_args_bound(self):
+        rows = self.utils.stream_query('select value from numbers where value > ? and square < ? order by value', (2, 30))
+        self.assertEqual(list(rows), [(3,), (4,), (5,)])
+
+    def test_invalid_output_rejected(self):
+        self.assertRaises(ValueError, list, self.utils.stream_query('select value from numbers', output='csv'))
+
+
+class StatementCacheTestCase(unittest.TestCase):
+
+    def test_least_recently_used_statement_dropped(self):
+        """ The least recently used statement is dropped when the cache is full """
+        cache = StatementCache(2)
+        cache.get('a', lambda: 'A')
+        cache.get('b', lambda: 'B')
+        cache.get('a', lambda: 'not rebuilt')
+        cache.get('c', lambda: 'C')
+        self.assertEqual(cache.get('a', lambda: 'rebuilt'), 'A')
+        self.assertEqual(cache.get('b', lambda: 'rebuilt'), 'rebuilt')
+
+    def test_zero_size_cache_builds_every_time(self):
+        """ A cache with max_size 0 holds nothing """
+        cache = StatementCache(0)
+        self.assertEqual(cache.get('a', lambda: 'A'), 'A')
+        self.assertEqual(len(cache), 0)
+
+
+class QueryPoolTestCase(unittest.TestCase):
+
+    def test_max_concurrency_limits_running_queries(self):
+        """ No more than max_concurrency queries run at the same time """
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        class SlowCursor(object):
+            def execute(self, cmd, args=None):
+                with lock:
+                    running.append(cmd)
+                    peak.append(len(running))
+                time.sleep(0.05)
+                with lock:
+                    running.remove(cmd)
+
+            def fetchall(self):
+                return []
+
+        class SlowBackend(object):
+            cursor = SlowCursor()
+
+            def clone(self):
+                return self
+
+            def get_current_database(self):
+                return None
+
+            def close(self):
+                pass
+
+        utils = DatabaseUtils(backend=SlowBackend(), max_concurrency=2)
+        try:
+            utils.gather_queries(['query %d' % i for i in range(8)], timeout=5)
+        finally:
+            utils.close()
+        self.assertEqual(max(peak), 2)
+
+    def test_gather_in_order(self):
+        """ Results of a gather are returned in the order the queries were given """
+        backend = SqliteBackend()
+        pool = QueryPool(backend, 3)
+        try:
+            self.assertEqual(pool.gather(['select %d' % i for i in range(6)], timeout=5),
+                             [[(i,)] for i in range(6)])
+        finally:
+            pool.close()
+            backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
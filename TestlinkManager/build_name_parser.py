@@ -0,0 +1,154 @@
+
+"""
+Module for extracting the upgrade path, build, rack and architecture from testlink build names
+
+The patterns are compiled once when the module is imported and every field is extracted in a single regex match,
+build names are parsed over and over again across reports so the parsed results are memoized
+
+path, build_name, rack, arch = parse_build_name('OVCA-2.3.1->2.3.3 2.3.3-b1234 burl5_X5-2')
+parsed = parse_build_names([build['name'] for build in builds])
+
+The upgrade paths to the current version are calculated once and indexed so a path can be validated in O(1)
+"""
+
+import re
+import threading
+
+from collections import OrderedDict
+
+from utils.testlink_utils.testlink_constants import *
+
+DEFAULT_MEMO_SIZE = 4096
+UNKNOWN_PATH = 'Unknown Path'
+NOT_AVAILABLE = 'N/a'
+
+# one match on the build name extracts every field, each field is an optional lookahead
+# so it finds the same leftmost match as a separate re.search would
+_BUILD_NAME_REGEX = re.compile(r'(?:(?=.*?(?P<path>(\s*(->)?\s*(\d\.\d\.\d)){1,5})))?'
+                               r'(?:(?=.*?(?P<build>%s-b\d*)))?'
+                               r'(?:(?=.*?(?P<rack>(burl|dub)[\d\-\_]+)_X))?'
+                               r'(?:(?=.*?(?P<arch>[Xx]\d[-_]2)))?' % CURR_PROJECT_VER, re.DOTALL)
+
+
+def lru_memoize(max_size=DEFAULT_MEMO_SIZE):
+    """
+    Decorator which caches the results of a function of hashable arguments, the least recently used result is
+    discarded once max_size results are cached. The cache can be emptied with function.cache_clear()
+    """
+    def decorator(function):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        def wrapper(*args):
+            with lock:
+                try:
+                    result = cache.pop(args)
+                    cache[args] = result
+                    return result
+                except KeyError:
+                    pass
+
+            result = function(*args)
+            with lock:
+                cache[args] = result
+                if len(cache) > max_size:
+                    cache.popitem(last=False)
+            return result
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def _calculate_upgrade_paths():
+    """ Finds all the possible upgrade paths to the current test version and filters this list based on MAX_NUM_UPGRADES """
+    paths = [CURR_PROJECT_VER]
+
+    for ver in reversed(SUPPORTED_VERSIONS[:-1]):
+        temp_paths = []
+        for path in paths:
+            temp_paths.append('%s->%s' % (ver, path))
+        paths.extend(temp_paths)
+
+    # apply filtering conditions to list of upgrade paths
+    paths[0] = FRESH + ' OPUS'
+    paths.insert(0, FRESH + ' CISCO')
+    paths = [path for path in paths if path.count('->') <= MAX_NUM_UPGRADES]
+    paths.extend([path + MIXED for path in paths[2:]])
+    paths.append(CURR_PROJECT_VER + '->' + CURR_PROJECT_VER)
+    return tuple(paths)
+
+
+UPGRADE_PATHS = _calculate_upgrade_paths()
+# position of each upgrade path in UPGRADE_PATHS
+UPGRADE_PATH_INDEX = {path: position for position, path in enumerate(UPGRADE_PATHS)}
+
+
+def get_upgrade_paths():
+    """ Returns a list of all the possible upgrade paths to the current test version (filtered by MAX_NUM_UPGRADES) """
+    return list(UPGRADE_PATHS)
+
+
+def is_valid_upgrade_path(path):
+    """ Returns true if the path is one of the possible upgrade paths to the current test version """
+    return path in UPGRADE_PATH_INDEX
+
+
+@lru_memoize()
+def parse_build_name(build):
+    """ Extracts the upgrade path, build, rack and architecture from a build name, returns them as a tuple """
+    match = _BUILD_NAME_REGEX.match(build)
+
+    lower_build = build.lower()
+    if MANDATORY_BUILD_PREFIX not in lower_build:
+        print 'Invalid Build Prefix [%s]' % lower_build
+        path = UNKNOWN_PATH
+    else:
+        path = _get_upgrade_path(match.group('path'), lower_build.replace(MANDATORY_BUILD_PREFIX, ''))
+
+    return path, match.group('build') or NOT_AVAILABLE, match.group('rack') or NOT_AVAILABLE, \
+        match.group('arch') or NOT_AVAILABLE
+
+
+def parse_build_names(builds):
+    """ Parses a list of build names, returns a list of (path, build, rack, arch) tuples in the same order
+    Each distinct build name is only parsed once
+    """
+    parsed = {}
+    for build in builds:
+        if build not in parsed:
+            parsed[build] = parse_build_name(build)
+    return [parsed[build] for build in builds]
+
+
+def get_upgrade_path_from_build(build):
+    """ Given a valid build name this will extract the upgrade path from it """
+    return parse_build_name(build)[0]
+
+
+def get_info_from_build_name(build):
+    """ Function which will extract the build, upgrade path, rack and architecture from a build """
+    return parse_build_name(build)
+
+
+def _get_upgrade_path(path, lower_build):
+    """ Converts the versions matched in a build name to an upgrade path
+
+    path:        (string) The versions matched in the build name, None if there was no match
+    lower_build: (string) The lower case build name with the mandatory prefix removed
+    """
+    # FIXME improve the regular expression to detect more poorly entered upgrade paths
+    if path is None:
+        print 'Unrecognized upgrade path [%s]' % lower_build
+        return UNKNOWN_PATH
+
+    path = path.replace(' ', '')
+    if path == CURR_PROJECT_VER:
+        return FRESH + ' CISCO' if any(rack_name in lower_build for rack_name in CISCO_RACKS) else FRESH + ' OPUS'
+    return path + MIXED if 'mixed' in lower_build else path
@@ -0,0 +1,70 @@
+"""
+Tests for build_name_parser, the build names are made from the versions in testlink_constants
+
+python -m unittest test_build_name_parser
+"""
+
+import unittest
+
+from build_name_parser import (NOT_AVAILABLE, UNKNOWN_PATH, UPGRADE_PATHS, get_upgrade_path_from_build,
+                               is_valid_upgrade_path, parse_build_name, parse_build_names)
+from utils.testlink_utils.testlink_constants import CISCO_RACKS, CURR_PROJECT_VER, FRESH, MIXED, SUPPORTED_VERSIONS
+
+VERSIONS = {'old': SUPPORTED_VERSIONS[0], 'prev': SUPPORTED_VERSIONS[-2], 'curr': CURR_PROJECT_VER,
+            'cisco': CISCO_RACKS[0]}
+
+# build name: (path, build, rack, arch)
+BUILD_NAMES = [
+    ('OVCA-{old}->{curr}-b1234_burl5_X5-2', ('{old}->{curr}', '{curr}-b1234', 'burl5', 'X5-2')),
+    ('OVCA-{old}->{prev}->{curr}-b88_dub3_X6_2', ('{old}->{prev}->{curr}', '{curr}-b88', 'dub3', 'X6_2')),
+    ('OVCA-{curr}-b7_burl5_x5-2', (FRESH + ' OPUS', '{curr}-b7', NOT_AVAILABLE, 'x5-2')),
+    ('OVCA-{curr}-b7 {cisco}', (FRESH + ' CISCO', '{curr}-b7', NOT_AVAILABLE, NOT_AVAILABLE)),
+    ('OVCA-{prev}->{curr}-b55 Mixed', ('{prev}->{curr}' + MIXED, '{curr}-b55', NOT_AVAILABLE, NOT_AVAILABLE)),
+    ('OVCA-{curr}->{curr}-b3', ('{curr}->{curr}', '{curr}-b3', NOT_AVAILABLE, NOT_AVAILABLE)),
+    ('nightly-{curr}-b1', (UNKNOWN_PATH, '{curr}-b1', NOT_AVAILABLE, NOT_AVAILABLE)),
+    ('OVCA-nightly', (UNKNOWN_PATH, NOT_AVAILABLE, NOT_AVAILABLE, NOT_AVAILABLE)),
+]
+
+
+def _format(text):
+    return text.format(**VERSIONS)
+
+
+class BuildNameParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        parse_build_name.cache_clear()
+
+    def test_build_names(self):
+        for build_name, expected in BUILD_NAMES:
+            build_name = _format(build_name)
+            self.assertEqual(parse_build_name(build_name), tuple(_format(field) for field in expected), build_name)
+            self.assertEqual(get_upgrade_path_from_build(build_name), _format(expected[0]))
+
+    def test_parsed_paths_are_valid_upgrade_paths(self):
+        for build_name, expected in BUILD_NAMES:
+            self.assertEqual(is_valid_upgrade_path(_format(expected[0])), expected[0] != UNKNOWN_PATH)
+        self.assertFalse(is_valid_upgrade_path('0.0.1->%s' % CURR_PROJECT_VER))
+        self.assertFalse(is_valid_upgrade_path(None))
+        self.assertTrue(all(is_valid_upgrade_path(path) for path in UPGRADE_PATHS))
+
+    def test_parse_build_names_keeps_order(self):
+        """ Every name is parsed, repeated names included, and the results are in the order of the names """
+        build_names = [_format(build_name) for build_name, _ in BUILD_NAMES]
+        build_names = build_names + list(reversed(build_names))
+        self.assertEqual(parse_build_names(build_names), [parse_build_name(build_name) for build_name in build_names])
+        self.assertEqual(parse_build_names([]), [])
+
+    def test_cache_clear(self):
+        """ Results are memoized until cache_clear() is called """
+        build_name = _format(BUILD_NAMES[0][0])
+        parsed = parse_build_name(build_name)
+        self.assertIs(parse_build_name(build_name), parsed)
+
+        parse_build_name.cache_clear()
+        self.assertIsNot(parse_build_name(build_name), parsed)
+        self.assertEqual(parse_build_name(build_name), parsed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+Tests for testlink_utilities against a stub testlink XML-RPC server running in the test process
+
+python -m unittest test_testlink_utilities
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+from SocketServer import ThreadingMixIn
+
+from testlink_utilities import TestLinkSession
+
+PLAN_ID = '10'
+NUM_TESTS = 12
+# build id: (name, is_open)
+BUILDS = {'1': ('OVCA-2.3.1->2.3.3 2.3.3-b1', '0'), '2': ('OVCA-2.3.2->2.3.3 2.3.3-b2', '0'), '3': ('OVCA-2.3.3 2.3.3-b3', '1')}
+
+
+class StubTestLinkServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    Stub testlink server with one test plan of NUM_TESTS tests run on BUILDS,
+    getTestCase calls take delay seconds and are counted along with the most which were in flight at once
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.1):
+        SimpleXMLRPCServer.__init__(self, ('127.0.0.1', 0), logRequests=False)
+        self.delay = delay
+        self.versions = dict((str(100 + i), '1') for i in range(NUM_TESTS))
+        self.fetched = []
+        self.fetched_builds = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        self.register_function(self.get_builds_for_test_plan, 'tl.getBuildsForTestPlan')
+        self.register_function(self.get_test_cases_for_test_plan, 'tl.getTestCasesForTestPlan')
+        self.register_function(self.get_test_case, 'tl.getTestCase')
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def get_builds_for_test_plan(self, args):
+        return [{'id': build_id, 'name': name, 'is_open': is_open} for build_id, (name, is_open) in BUILDS.items()]
+
+    def get_test_cases_for_test_plan(self, args):
+        build_id = args.get('buildid')
+        if build_id is not None:
+            self.fetched_builds.append(str(build_id))
+        # test 10x passes on the builds with an id less than x and fails on the others
+        return dict((tc_id, {'0': {'tcase_id': tc_id, 'version': version,
+                                   'exec_status': 'n' if build_id is None else 'pf'[int(build_id) >= int(tc_id) - 100]}})
+                    for tc_id, version in self.versions.items())
+
+    def get_test_case(self, args):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            self.fetched.append((args['testcaseid'], str(args['version'])))
+
+        return [{'testcase_id': args['testcaseid'], 'version': str(args['version']),
+                 'tc_external_id': 'OVCA-%s' % args['testcaseid'], 'name': 'test %s' % args['testcaseid'],
+                 'importance': '2', 'creation_ts': '2016-01-01 00:00:00'}]
+
+
+class TestLinkSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubTestLinkServer()
+        self.cache_dir = tempfile.mkdtemp()
+        self.sessions = []
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.close()
+        self.server.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def _create_session(self, max_workers=4):
+        session = TestLinkSession(self.server.url, 'key', 1, max_workers=max_workers, cache_dir=self.cache_dir)
+        self.sessions.append(session)
+        return session
+
+    def test_details_fetched_concurrently(self):
+        """ The details of every test are fetched with at most max_workers calls in flight """
+        session = self._create_session(max_workers=4)
+
+        start = time.time()
+        details = session.get_test_case_details_from_plan(PLAN_ID)
+        self.assertEqual(sorted(details), sorted(self.server.versions))
+        self.assertEqual(details['105']['tc_external_id'], 'OVCA-105')
+        self.assertEqual(self.server.max_in_flight, 4)
+        self.assertLess(time.time() - start, NUM_TESTS * self.server.delay)
+
+    def test_second_run_uses_cache(self):
+        """ Details which were fetched once are not fetched again by the same session """
+        session = self._create_session()
+        first = session.get_test_case_details_from_plan(PLAN_ID)
+        self.assertEqual(len(self.server.fetched), NUM_TESTS)
+
+        self.assertEqual(session.get_test_case_details_from_plan(PLAN_ID), first)
+        self.assertEqual(len(self.server.fetched), NUM_TESTS)
+
+    def test_disk_cache_keyed_by_version(self):
+        """ A new session reads the details from disk, only a test whose version changed is fetched again """
+        self._create_session().get_test_case_details_from_plan(PLAN_ID)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, '103_v1.json')))
+
+        self.server.fetched = []
+        self.server.versions['103'] = '2'
+        details = self._create_session().get_test_case_details_from_plan(PLAN_ID)
+        self.assertEqual(self.server.fetched, [('103', '2')])
+        self.assertEqual(details['103']['version'], '2')
+        self.assertEqual(details['104']['version'], '1')
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, '103_v2.json')))
+
+    def test_execution_index_saved_between_runs(self):
+        """ A new session loads the saved execution index and only fetches the build which is still open """
+        session = self._create_session()
+        session.execution_index.update(session, PLAN_ID)
+        counts = session.execution_index.get_test_counts(PLAN_ID)
+        self.assertEqual(sorted(self.server.fetched_builds), ['1', '2', '3'])
+        self.assertEqual(counts['100'], {'exec': 3, 'pass': 0, 'fail': 3})
+        self.assertEqual(counts['102'], {'exec': 3, 'pass': 1, 'fail': 2})
+
+        self.server.fetched_builds = []
+        session = self._create_session()
+        session.execution_index.update(session, PLAN_ID)
+        self.assertEqual(self.server.fetched_builds, ['3'])
+        self.assertEqual(session.execution_index.get_test_counts(PLAN_ID), counts)
+        self.assertEqual(session.execution_index.get_path_statuses(PLAN_ID),
+                         self.sessions[0].execution_index.get_path_statuses(PLAN_ID))
+
+
+if __name__ == '__main__':
+    unittest.main()
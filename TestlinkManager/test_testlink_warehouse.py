@@ -0,0 +1,136 @@
+"""
+Tests for testlink_warehouse, synced from a fake session which returns canned testlink results
+
+python -m unittest test_testlink_warehouse
+"""
+
+import unittest
+
+from datetime import datetime
+
+from testlink_utilities import ExecutionIndex
+from testlink_warehouse import TestLinkWarehouse
+
+PLAN_ID = '1'
+
+
+class FakeSession(object):
+    """
+    Stands in for a TestLinkSession, a test plan is made of its builds and test case details,
+    the results of each build are {tc_id: (execution id, status)} and the last execution of each test is
+    {tc_id: (execution id, execution timestamp)}
+    """
+
+    def __init__(self):
+        self.plans = {}
+        self.builds = {}
+        self.details = {}
+        self.results = {}
+        self.last_executions = {}
+        self.fetched_builds = []
+        self.execution_index = ExecutionIndex()
+
+    def add_plan(self, plan_id, tests):
+        """ Adds a plan of tests given as {tc_id: (version, name)} """
+        self.plans[plan_id] = {'id': plan_id, 'name': 'plan %s' % plan_id, 'active': '1'}
+        self.builds[plan_id] = []
+        self.details[plan_id] = dict((tc_id, {'testcase_id': tc_id, 'tc_external_id': 'OVCA-%s' % tc_id, 'name': name,
+                                              'importance': '2', 'creation_ts': '2026-01-01 00:00:00', 'version': version})
+                                     for tc_id, (version, name) in tests.items())
+
+    def add_build(self, plan_id, build_id, is_open, release_date):
+        for build in self.builds[plan_id]:
+            build['is_open'] = '0'
+        self.builds[plan_id].append({'id': build_id, 'name': 'OVCA-2.3.3 2.3.3-b%s' % build_id, 'is_open': is_open,
+                                     'release_date': release_date})
+        self.results[build_id] = {}
+
+    def execute(self, build_id, tc_id, execution_id, status, execution_ts):
+        self.results[build_id][tc_id] = (execution_id, status)
+        self.last_executions[tc_id] = (execution_id, execution_ts)
+
+    def get_test_plans(self):
+        return list(self.plans.values())
+
+    def get_build_info_from_plan(self, plan_id):
+        return [dict(build) for build in self.builds[str(plan_id)]]
+
+    def get_test_case_details_from_plan(self, plan_id):
+        return self.details[str(plan_id)]
+
+    def get_last_execution_info_for_tests(self, plan_id, tc_ids):
+        return dict((tc_id, {'id': self.last_executions[str(tc_id)][0], 'execution_ts': self.last_executions[str(tc_id)][1]})
+                    for tc_id in tc_ids)
+
+    def get_build_results(self, plan_id, builds):
+        self.fetched_builds.extend(build['id'] for build in builds)
+        return [(build, [{'tcase_id': tc_id, 'exec_status': status, 'exec_id': execution_id}
+                         for tc_id, (execution_id, status) in self.results[build['id']].items()])
+                for build in builds]
+
+
+class TestLinkWarehouseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.warehouse = TestLinkWarehouse(':memory:', self.session)
+
+    def tearDown(self):
+        self.warehouse.close()
+
+    def _get_execution_timestamps(self):
+        return dict((row[0], row[1:]) for row in self.warehouse._connection.execute(
+            'SELECT execution_id, execution_ts, ts_estimated FROM executions'))
+
+    def test_superseded_executions_get_estimated_timestamps(self):
+        """
+        An execution which is not the last of its test gets the release date of its build when the build is new,
+        or the sync time when the build was synced before, the reports only use the timestamps from testlink
+        """
+        self.session.add_plan(PLAN_ID, {'1': ('1', 'test 1'), '2': ('1', 'test 2')})
+        self.session.add_build(PLAN_ID, '10', '0', '2026-01-05')
+        self.session.add_build(PLAN_ID, '11', '1', '2026-02-01')
+        self.session.execute('10', '1', '100', 'f', '2026-01-05 10:00:00')
+        self.session.execute('11', '1', '101', 'p', '2026-02-03 10:00:00')
+        self.session.execute('10', '2', '102', 'p', '2026-01-06 09:00:00')
+        self.assertEqual(self.warehouse.sync(), 3)
+
+        self.assertEqual(self._get_execution_timestamps(), {100: ('2026-01-05 00:00:00', 1),
+                                                            101: ('2026-02-03 10:00:00', 0),
+                                                            102: ('2026-01-06 09:00:00', 0)})
+
+        self.session.execute('11', '2', '103', 'f', '2026-02-04 10:00:00')
+        self.session.add_build(PLAN_ID, '12', '1', '2026-02-10')
+        self.session.execute('12', '2', '104', 'p', '2026-02-11 10:00:00')
+        self.session.fetched_builds = []
+        self.assertEqual(self.warehouse.sync(), 2)
+        self.assertEqual(self.session.fetched_builds, ['11', '12'])
+
+        timestamps = self._get_execution_timestamps()
+        self.assertEqual(timestamps[103][1], 1)
+        self.assertTrue(timestamps[103][0].startswith(datetime.now().strftime('%Y-%m-%d')))
+        self.assertEqual(timestamps[104], ('2026-02-11 10:00:00', 0))
+
+        self.assertEqual(self.warehouse.get_last_execution_ts(PLAN_ID), '2026-02-11 10:00:00')
+        self.assertEqual(sum(passed + failed for days in self.warehouse.get_path_trend(PLAN_ID).values()
+                             for day, passed, failed, blocked in days), 5)
+
+        # the builds fetched by the sync were added to the session's execution index, the open build is fetched again
+        self.session.fetched_builds = []
+        self.session.execution_index.update(self.session, PLAN_ID)
+        self.assertEqual(self.session.fetched_builds, ['12'])
+        self.assertEqual(self.session.execution_index.get_plan_counts(PLAN_ID), {'exec': 5, 'pass': 3, 'fail': 2})
+
+    def test_test_case_versions_kept_per_plan(self):
+        """ Plans which use different versions of a test report the details of their own version """
+        self.session.add_plan('1', {'7': ('1', 'old name')})
+        self.session.add_plan('2', {'7': ('2', 'new name')})
+        self.warehouse.sync()
+
+        self.assertEqual(self.warehouse.find_not_run_for_n_days('1')['MEDIUM'], [('OVCA-7', 'old name')])
+        self.assertEqual(self.warehouse.find_not_run_for_n_days('2')['MEDIUM'], [('OVCA-7', 'new name')])
+        self.assertEqual(self.warehouse._connection.execute('SELECT COUNT(*) FROM test_cases').fetchone()[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
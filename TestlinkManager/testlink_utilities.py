@@ -5,10 +5,23 @@ This class relies on the TestLinkHelper module and TestlinkAPIClient module whic
 
 The class includes get methods for retriving information from the testlink webserver
 This class also inculdes methods for altering information on the testlink webserver
+
+Per test case calls (getTestCase, getLastExecutionResult) are issued concurrently over a pool of API clients
+(concurrent.futures, which needs the futures backport package on python 2),
+test case details are immutable for a given version so they can be cached on disk and reused between runs
+
+session = TestLinkSession(max_workers=16, cache_dir='/var/cache/testlink')
+
+Execution statistics are answered from an ExecutionIndex which fetches the results of each build once,
+later reports (and later runs, the index is saved in cache_dir) only fetch builds which are new or still open
 """
 
-import re
+import json
+import os
+import tempfile
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint as pp
 from datetime import datetime
 
@@ -16,60 +29,13 @@ from testlink.testlinkapi import TestlinkAPIClient
 from testlink.testlinkhelper import TestLinkHelper
 from utils.testlink_utils.testlink_constants import *
 
+from build_name_parser import get_upgrade_paths, get_upgrade_path_from_build, get_info_from_build_name
 
-def get_upgrade_paths():
-    """ Finds all the possible upgrade paths to the current test version and filters this list based on MAX_NUM_UPGRADES """
-    paths = [CURR_PROJECT_VER]
-
-    for ver in reversed(SUPPORTED_VERSIONS[:-1]):
-        temp_paths = []
-        for path in paths:
-            temp_paths.append('%s->%s' % (ver, path))
-        paths.extend(temp_paths)
-
-    # apply filtering conditions to list of upgrade paths
-    paths[0] = FRESH + ' OPUS'
-    paths.insert(0, FRESH + ' CISCO')
-    paths = [path for path in paths if path.count('->') <= MAX_NUM_UPGRADES]
-    paths.extend([path + MIXED for path in paths[2:]])
-    paths.append(CURR_PROJECT_VER + '->' + CURR_PROJECT_VER)
-    return paths
-
-
-def get_upgrade_path_from_build(build):
-    """ Given a valid build name this will extract the upgrade path from it """
-    # FIXME improve the regular expression to detect more poorly entered upgrade paths
-
-    build = build.lower()
-    if MANDATORY_BUILD_PREFIX not in build:
-        print 'Invalid Build Prefix [%s]' % build
-        return 'Unknown Path'
-    build = build.replace(MANDATORY_BUILD_PREFIX, '')
-    regex = '(\s*(->)?\s*(\d\.\d\.\d)){1,5}'
-    match = re.search(regex, build)
-    if match:
-        path = match.group().replace(' ', '')
-        if path == CURR_PROJECT_VER:
-            return FRESH + ' CISCO' if any(rack_name in build for rack_name in CISCO_RACKS) else FRESH + ' OPUS'
-        else:
-            return path + MIXED if 'mixed' in build else path
-    print 'Unrecognized upgrade path [%s]' % build
-    return 'Unknown Path'
-
+DEFAULT_FETCH_WORKERS = 8
+EXECUTION_INDEX_FILE = 'execution_index.json'
 
-def get_info_from_build_name(build):
-    """ Function which will extract the build, upgrade path, rack and architecture from a build """
-    build_match = re.search('%s-b\d*' % CURR_PROJECT_VER, build)
-    build_name = build_match.group() if build_match else 'N/a'
-
-    rack_match = re.search('((burl|dub)[\d\-\_]+)_X', build)
-    rack = rack_match.group(1) if rack_match else 'N/a'
-
-    arch_match = re.search('[Xx]\d[-_]2', build)
-    arch = arch_match.group() if arch_match else 'N/a'
-
-    path = get_upgrade_path_from_build(build)
-    return path, build_name, rack, arch
+# status of a test which is not part of the plan for a build in an ExecutionIndex
+NOT_IN_BUILD = 0
 
 
 # FIXME: Probably don't need this
@@ -82,6 +48,26 @@ def connect_to_testlink(testlink_server_url, developer_key):
     return tl_helper.connect(tl_client)
 
 
+def filter_test_case_info(testcase):
+    """ Given the details of a test case (from getTestCase) returns its internal id and a dictionary of the fields we report on
+    The details are not modified so they can be shared with the test case cache
+    """
+    if testcase['importance'] == '1':
+        importance = 'LOW'
+    elif testcase['importance'] == '2':
+        importance = 'MEDIUM'
+    else:
+        importance = 'HIGH'
+
+    return testcase['testcase_id'], {'id': testcase['tc_external_id'],
+                                     'name': testcase['name'].replace(u'\u2013', '-'),
+                                     'importance': importance,
+                                     'creation_ts': testcase['creation_ts'],
+                                     'x0-2_exec': 0,
+                                     'x0-2_pass': 0,
+                                     'x0-2_fail': 0}
+
+
 # FIXME: Can be moved to general utilities
 def list_to_dict(l, key):
     """ Converts a list of dictionaries to a dictionary of dictionaries based on a specified key """
@@ -94,13 +80,289 @@ def list_to_dict(l, key):
     return return_dict
 
 
+class TestCaseCache(object):
+    """
+    Cache of test case details keyed by test case id and version
+    A version of a test case does not change once it is created so entries never need to be invalidated
+    If a directory is given every entry is also written to it as a json file so the cache is kept between runs
+    """
+
+    def __init__(self, directory=None):
+        """ Initiator
+
+        directory: (string) Directory the entries are stored in, the cache is only held in memory if not given
+        """
+        self._directory = directory
+        self._entries = {}
+
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, tc_id, version):
+        """ Returns the cached details of a version of a test case, None if it has not been cached """
+        key = (str(tc_id), str(version))
+        details = self._entries.get(key)
+        if details is None and self._directory is not None:
+            try:
+                with open(self._get_path(*key)) as cache_file:
+                    details = json.load(cache_file)
+            except (IOError, ValueError):
+                return None
+            self._entries[key] = details
+        return details
+
+    def put(self, tc_id, version, details):
+        """ Stores the details of a version of a test case """
+        key = (str(tc_id), str(version))
+        self._entries[key] = details
+        if self._directory is not None:
+            # write to a temporary file first so a partially written entry is never read
+            file_descriptor, temp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'w') as cache_file:
+                json.dump(details, cache_file)
+            os.rename(temp_path, self._get_path(*key))
+
+    def _get_path(self, tc_id, version):
+        """ Returns the path of the file an entry is stored in """
+        return os.path.join(self._directory, '%s_v%s.json' % (tc_id, version))
+
+
+class TestLinkClientPool(object):
+    """
+    Makes API calls to the testlink server concurrently on a ThreadPoolExecutor
+    An xmlrpc client can not be shared between threads so each worker thread connects with its own TestlinkAPIClient
+    At most max_workers calls are in flight at once, the rest wait in the executor's queue
+    """
+
+    def __init__(self, testlink_server_url, developer_key, max_workers=DEFAULT_FETCH_WORKERS):
+        """ Initiator (each worker thread connects when it makes its first call) """
+        self._testlink_server_url = testlink_server_url
+        self._developer_key = developer_key
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._local = threading.local()
+
+    def submit(self, method, *args, **kwargs):
+        """ Queues a call of a TestlinkAPIClient method (i.e. 'getTestCase') and returns a Future for its result """
+        return self._executor.submit(self._call, method, args, kwargs)
+
+    def map(self, method, args_list, timeout=None):
+        """ Calls a method once for each tuple of arguments concurrently and returns the results in the same order
+        Raises concurrent.futures.TimeoutError if the calls do not complete within timeout seconds
+        """
+        return list(self._executor.map(lambda args: self._call(method, args, {}), args_list, timeout=timeout))
+
+    def close(self):
+        """ Stops the workers once the queued calls have completed """
+        self._executor.shutdown(wait=True)
+
+    def _call(self, method, args, kwargs):
+        """ Makes a call on the connection of the worker thread it runs on """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect_to_testlink(self._testlink_server_url, self._developer_key)
+        return getattr(connection, method)(*args, **kwargs)
+
+
+class ExecutionIndex(object):
+    """
+    Index of the execution status of every test on every build of a test plan
+    Each build's results are fetched once with getTestCasesForTestPlan and stored as one byte per (test, build),
+    each build is labelled with its upgrade path so counts can be answered per path or for the whole plan
+
+    Builds which are closed can not have new executions so they are never fetched again,
+    builds which are still open are fetched again on each update to pick up new executions
+    If a path is given the index is saved to it as a json file after each update and loaded from it when created,
+    so later runs only fetch the builds which are new or still open
+    """
+
+    def __init__(self, path=None):
+        """ Initiator, loads the saved index if there is one
+
+        path: (string) File the index is saved in, the index is only held in memory if not given
+        """
+        self._path = path
+        self._plans = {}
+
+        if path is not None:
+            self.load()
+
+    def load(self):
+        """ Replaces the index with the one saved in the index file, the index is left empty if it can not be read """
+        try:
+            with open(self._path) as index_file:
+                plans = json.load(index_file)
+        except (IOError, ValueError):
+            return
+
+        for plan in plans.values():
+            plan['statuses'] = dict((tc_id, bytearray(statuses.encode('latin-1')))
+                                    for tc_id, statuses in plan['statuses'].items())
+        self._plans = plans
+
+    def save(self):
+        """ Writes the index to the index file """
+        plans = dict((plan_id, dict(plan, statuses=dict((tc_id, str(statuses)) for tc_id, statuses in plan['statuses'].items())))
+                     for plan_id, plan in self._plans.items())
+        # write to a temporary file first so a partially written index is never read
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._path)), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w') as index_file:
+            json.dump(plans, index_file)
+        os.rename(temp_path, self._path)
+
+    def update(self, session, plan_id, builds=None):
+        """ Fetches the results of the builds which are not in the index (or are still open) concurrently
+
+        session: (TestLinkSession) Session used to fetch the results
+        builds:  (list)            Build dictionaries (as returned by getBuildsForTestPlan), all builds in the plan if not given
+        """
+        if builds is None:
+            builds = session.get_build_info_from_plan(plan_id)
+        positions = self._plans.get(str(plan_id), {}).get('positions', {})
+        builds = [build for build in builds if build['id'] not in positions or build.get('is_open') == '1']
+        if builds:
+            self.add_build_results(plan_id, session.get_build_results(plan_id, builds))
+
+    def add_build_results(self, plan_id, build_results):
+        """ Stores the results of builds which were already fetched and saves the index
+
+        build_results: (list) (build, testcases) pairs as returned by TestLinkSession.get_build_results
+        """
+        plan = self._plans.setdefault(str(plan_id), {'build_ids': [], 'paths': [], 'positions': {}, 'statuses': {}})
+        for build, testcases in build_results:
+            self._add_build(plan, build, testcases)
+
+        if self._path is not None:
+            self.save()
+
+    def get_paths(self, plan_id):
+        """ Returns the upgrade paths of the builds in the index for a plan """
+        return sorted(set(self._get_plan(plan_id)['paths']))
+
+    def get_test_counts(self, plan_id, path=None, build_ids=None):
+        """
+        Returns a dictionary keyed by test case id with how many times each test was executed, passed and failed
+        Counts cover every indexed build of the plan, or only the builds on an upgrade path and/or in a list of build ids
+        """
+        plan = self._get_plan(plan_id)
+        positions = self._get_positions(plan, path, build_ids)
+        every_build = len(positions) == len(plan['build_ids'])
+        passed, failed = b'p', b'f'
+
+        counts = {}
+        for tc_id, statuses in plan['statuses'].items():
+            if not every_build:
+                statuses = bytearray(statuses[position] for position in positions)
+            num_pass = statuses.count(passed)
+            num_fail = statuses.count(failed)
+            counts[tc_id] = {'exec': num_pass + num_fail, 'pass': num_pass, 'fail': num_fail}
+        return counts
+
+    def get_plan_counts(self, plan_id, build_ids=None):
+        """ Returns the total number of executions, passes and fails across all tests in a plan """
+        totals = {'exec': 0, 'pass': 0, 'fail': 0}
+        for counts in self.get_test_counts(plan_id, build_ids=build_ids).values():
+            for key in totals:
+                totals[key] += counts[key]
+        return totals
+
+    def get_path_statuses(self, plan_id, build_ids=None):
+        """
+        Returns the execution status of each test on each upgrade path
+        {path: {tc_id: {'e': last status, 'p': num passed, 'f': num failed, 'b': num blocked}}}
+        The last status is taken from the most recent build on the path the test was executed on
+        """
+        plan = self._get_plan(plan_id)
+        identified_tests = {}
+
+        for position in self._get_positions(plan, None, build_ids):
+            path_tests = identified_tests.setdefault(plan['paths'][position], {})
+            for tc_id, statuses in plan['statuses'].items():
+                status = statuses[position]
+                if status == NOT_IN_BUILD:
+                    continue
+                status = chr(status)
+                test = path_tests.get(tc_id)
+                if test is None:
+                    test = path_tests[tc_id] = {'e': status, 'p': 0, 'f': 0, 'b': 0}
+                elif status != 'n':
+                    test['e'] = status
+                if status in ('p', 'f', 'b'):
+                    test[status] += 1
+        return identified_tests
+
+    def _get_plan(self, plan_id):
+        """ Returns the index entry of a plan, raises a KeyError if the plan has not been indexed """
+        try:
+            return self._plans[str(plan_id)]
+        except KeyError:
+            raise KeyError("Plan [%s] has not been indexed, call update() first" % plan_id)
+
+    @staticmethod
+    def _get_positions(plan, path, build_ids):
+        """ Returns the positions of the builds in the status arrays, in the order the builds were given """
+        if build_ids is None:
+            positions = range(len(plan['build_ids']))
+        else:
+            positions = [plan['positions'][build_id] for build_id in build_ids if build_id in plan['positions']]
+        if path is not None:
+            positions = [position for position in positions if plan['paths'][position] == path]
+        return positions
+
+    @staticmethod
+    def _add_build(plan, build, testcases):
+        """ Stores the status of every test in a build, replacing the previous results if the build was already indexed """
+        position = plan['positions'].get(build['id'])
+        if position is None:
+            position = len(plan['build_ids'])
+            plan['positions'][build['id']] = position
+            plan['build_ids'].append(build['id'])
+            plan['paths'].append(get_upgrade_path_from_build(build['name']))
+            for statuses in plan['statuses'].values():
+                statuses.append(NOT_IN_BUILD)
+        else:
+            for statuses in plan['statuses'].values():
+                statuses[position] = NOT_IN_BUILD
+
+        num_builds = len(plan['build_ids'])
+        for testcase in testcases:
+            statuses = plan['statuses'].get(testcase['tcase_id'])
+            if statuses is None:
+                statuses = plan['statuses'][testcase['tcase_id']] = bytearray(num_builds)
+            statuses[position] = ord(testcase['exec_status'][0])
+
+
 class TestLinkSession():
 
-    def __init__(self, testlink_server_url=TESTLINK_SERVER_URL, developer_key=TEST_RUNNER_DEV_KEY, project_id=CURR_PROJECT_ID):
-        """ Creates an object for handling communication with a test link project """
+    def __init__(self, testlink_server_url=TESTLINK_SERVER_URL, developer_key=TEST_RUNNER_DEV_KEY, project_id=CURR_PROJECT_ID,
+                 max_workers=DEFAULT_FETCH_WORKERS, cache_dir=None):
+        """ Creates an object for handling communication with a test link project
+
+        max_workers: (int)    Number of concurrent connections used for per test case calls
+        cache_dir:   (string) Directory test case details and the execution index are kept in between runs,
+                              only kept in memory if not given
+        """
         self._tl_connection = connect_to_testlink(testlink_server_url, developer_key)
         self._project_number = project_id
 
+        self._testlink_server_url = testlink_server_url
+        self._developer_key = developer_key
+        self._max_workers = max_workers
+        self._client_pool = None
+        self._test_case_cache = TestCaseCache(cache_dir)
+        self.execution_index = ExecutionIndex(os.path.join(cache_dir, EXECUTION_INDEX_FILE) if cache_dir else None)
+
+    def close(self):
+        """ Stops the worker threads used for concurrent calls """
+        if self._client_pool is not None:
+            self._client_pool.close()
+            self._client_pool = None
+
+    def _get_client_pool(self):
+        """ Returns the pool used for concurrent calls, the pool is started the first time it is needed """
+        if self._client_pool is None:
+            self._client_pool = TestLinkClientPool(self._testlink_server_url, self._developer_key, self._max_workers)
+        return self._client_pool
+
     def get_projects(self):
         """ Returns a list of dictionaries containing information about all projects in testlink """
         return self._tl_connection.getProjects()
@@ -133,10 +395,48 @@ class TestLinkSession():
         """ Returns a list of dictionaries containing information on all test for a certain build in a testplan """
         return [testcase.values()[0] for testcase in self._tl_connection.getTestCasesForTestPlan(plan_id, buildid=build_id).values()]
 
+    def get_build_results(self, plan_id, builds):
+        """ Fetches the test cases of each build concurrently and returns a list of (build, list of test case dictionaries)
+        pairs in the order the builds were given
+        """
+        pool = self._get_client_pool()
+        futures = [(build, pool.submit('getTestCasesForTestPlan', plan_id, buildid=build['id'])) for build in builds]
+        build_results = []
+        for build, future in futures:
+            testcases = future.result()
+            # testlink returns an empty list rather than a dictionary for a build without tests
+            testcases = [testcase.values()[0] for testcase in testcases.values()] if isinstance(testcases, dict) else []
+            build_results.append((build, testcases))
+        return build_results
+
     def get_test_case_details(self, tc_id):
         """ Returns details about a specific testcase """
         return self._tl_connection.getTestCase(tc_id)[0]
 
+    def get_test_case_details_from_plan(self, plan_id):
+        """
+        Returns a dictionary with the details of every testcase in a testplan keyed by the tests internal id
+        Details are read from the test case cache, the versions which are not cached are fetched concurrently
+        """
+        versions = [(testcase.values()[0]['tcase_id'], testcase.values()[0]['version'])
+                    for testcase in self._tl_connection.getTestCasesForTestPlan(plan_id).values()]
+
+        details = {}
+        missing = []
+        for tc_id, version in versions:
+            cached = self._test_case_cache.get(tc_id, version)
+            if cached is None:
+                missing.append((tc_id, version))
+            else:
+                details[tc_id] = cached
+
+        pool = self._get_client_pool()
+        futures = [(tc_id, version, pool.submit('getTestCase', tc_id, version=int(version))) for tc_id, version in missing]
+        for tc_id, version, future in futures:
+            details[tc_id] = future.result()[0]
+            self._test_case_cache.put(tc_id, version, details[tc_id])
+        return details
+
     def get_build_info_from_plan(self, plan_id):
         """ Returns a list of dictionaries containing information about each build in the test plan """
         return self._tl_connection.getBuildsForTestPlan(plan_id)
@@ -166,6 +466,12 @@ class TestLinkSession():
         result = self._tl_connection.getLastExecutionResult(plan_id, tc_id)[0]
         return result if isinstance(result, dict) else result[0]
 
+    def get_last_execution_info_for_tests(self, plan_id, tc_ids):
+        """ Returns a dictionary with the last execution of each test case in a plan keyed by test case id, fetched concurrently """
+        tc_ids = list(tc_ids)
+        results = self._get_client_pool().map('getLastExecutionResult', [(plan_id, tc_id) for tc_id in tc_ids])
+        return {tc_id: result[0] if isinstance(result[0], dict) else result[0][0] for tc_id, result in zip(tc_ids, results)}
+
     def set_test_case_execution_type(self, tc_ext_id, type=1):
         """ Sets the execution type for a test in testlink to either manual or automated
 
@@ -177,70 +483,34 @@ class TestLinkSession():
 
     def get_test_case_info_from_id(self, tc_id):
         """ Given the test case id returns a large amount of information about a testcase in a dictionary """
-        testcase = self._tl_connection.getTestCase(tc_id)[0]
-        if testcase['importance'] == '1':
-            testcase['importance'] = 'LOW'
-        elif testcase['importance'] == '2':
-            testcase['importance'] = 'MEDIUM'
-        else:
-            testcase['importance'] = 'HIGH'
-
-        return testcase['testcase_id'], {'id': testcase['tc_external_id'],
-                                         'name': testcase['name'].replace(u'\u2013', '-'),
-                                         'importance': testcase['importance'],
-                                         'creation_ts': testcase['creation_ts'],
-                                         'x0-2_exec': 0,
-                                         'x0-2_pass': 0,
-                                         'x0-2_fail': 0}
+        return filter_test_case_info(self._tl_connection.getTestCase(tc_id)[0])
 
     def get_filtered_test_case_info_from_plan(self, plan_id):
         """
         Returns a dictionary of dictionaries containg information about every test case in a testplan
         The key to the top level dictionary is the tests internal id
         """
-        testcases = self.get_test_case_ids_from_plan(plan_id)
         filtered_info = {}
-        for testcase in testcases:
-            tc_id, tc_info = self.get_test_case_info_from_id(testcase)
+        for testcase in self.get_test_case_details_from_plan(plan_id).values():
+            tc_id, tc_info = filter_test_case_info(testcase)
             filtered_info[tc_id] = tc_info
         return filtered_info
 
     def determine_test_case_execution(self, test_case_info, plan_id):
         """ For a given test plan determines how many times each test has passed or failed accross all builds """
-        build_ids = self.get_build_ids_from_plan(plan_id)
-        for build_id in build_ids:
-            for testcase in self._tl_connection.getTestCasesForTestPlan(plan_id, buildid=build_id).values():
-                testcase_execution = testcase.values()[0]['exec_status']
-                testcase_id = testcase.values()[0]['tcase_id']
-                if testcase_execution == 'p':
-                    test_case_info[testcase_id]['x0-2_exec'] += 1
-                    test_case_info[testcase_id]['x0-2_pass'] += 1
-                elif testcase_execution == 'f':
-                    test_case_info[testcase_id]['x0-2_exec'] += 1
-                    test_case_info[testcase_id]['x0-2_fail'] += 1
+        builds = self.get_build_info_from_plan(plan_id)
+        self.execution_index.update(self, plan_id, builds)
+        counts = self.execution_index.get_test_counts(plan_id, build_ids=[build['id'] for build in builds])
+        for testcase_id, testcase_counts in counts.items():
+            if testcase_counts['exec']:
+                test_case_info[testcase_id]['x0-2_exec'] += testcase_counts['exec']
+                test_case_info[testcase_id]['x0-2_pass'] += testcase_counts['pass']
+                test_case_info[testcase_id]['x0-2_fail'] += testcase_counts['fail']
 
     def determine_test_case_execution_per_path(self, plan, tested_paths):
         """ Fills a dictionary with the execution status for each test on each possible build path """
-        identified_tests = {}
-        for path in tested_paths:
-            print path['name']
-            path_name = get_upgrade_path_from_build(path['name'])
-            identified_tests.setdefault(path_name, {})
-            run_tests = identified_tests[path_name].keys()
-            test_cases = self.get_test_case_info_from_build(plan['id'], path['id'])
-
-            for test_case in test_cases:
-                if test_case['tc_id'] not in run_tests:
-                    # add test execution and importance as a tuple to dictionary
-                    identified_tests[path_name][test_case['tc_id']] = {'e':test_case['exec_status'], 'p':0, 'f':0, 'b':0}
-                    if test_case['exec_status'] != 'n':
-                        identified_tests[path_name][test_case['tc_id']][test_case['exec_status']] += 1
-                else:
-                    # update dictionary with most recent build
-                    if test_case['exec_status'] != 'n':
-                        identified_tests[path_name][test_case['tc_id']]['e'] = test_case['exec_status']
-                        identified_tests[path_name][test_case['tc_id']][test_case['exec_status']] += 1
-        return identified_tests
+        self.execution_index.update(self, plan['id'], tested_paths)
+        return self.execution_index.get_path_statuses(plan['id'], [path['id'] for path in tested_paths])
 
     def find_not_run_for_n_days(self, plan_id, num_days=-1):
         """
@@ -250,8 +520,9 @@ class TestLinkSession():
         curr_time = datetime.now()
         not_run_tests = {'HIGH':[], 'MEDIUM':[], 'LOW':[]}
         testcases = self.get_filtered_test_case_info_from_plan(plan_id)
+        exec_results = self.get_last_execution_info_for_tests(plan_id, testcases.keys())
         for tc_id, tc_data in testcases.items():
-            exec_result = self.get_last_execution_info(plan_id, tc_id)
+            exec_result = exec_results[tc_id]
             if exec_result['id'] != -1:
                 last_execution_date = datetime.strptime(exec_result['execution_ts'],'%Y-%m-%d %H:%M:%S')
                 if num_days == -1 or (curr_time - last_execution_date).days <= num_days:
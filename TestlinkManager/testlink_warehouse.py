@@ -0,0 +1,246 @@
+
+"""
+Module which mirrors testlink plans, builds, test cases and executions into a local SQLite database
+
+Reports which ask time window questions (tests not run in n days, failure trend per upgrade path) query the local
+database instead of the testlink server
+
+warehouse = TestLinkWarehouse('/var/cache/testlink/warehouse.db', TestLinkSession(cache_dir='/var/cache/testlink'))
+warehouse.sync()
+not_run = warehouse.find_not_run_for_n_days(plan_id, 7)
+
+Syncing is incremental, builds which are closed can not have new executions so each is only fetched once
+and the timestamp is only requested for executions which are not in the database yet
+
+Testlink only reports the timestamp of the last execution of each test, an execution which had already been superseded
+when it was synced is given an estimated timestamp (flagged with ts_estimated) so it still counts in the trends:
+the time of the sync which first found it, or the release date of its build if the build was new to the database
+"""
+
+import sqlite3
+
+from datetime import datetime, timedelta
+
+from build_name_parser import get_upgrade_path_from_build
+from testlink_utilities import filter_test_case_info
+
+EXECUTION_TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS plans (plan_id INTEGER PRIMARY KEY, name TEXT, active INTEGER, '
+    'last_sync_ts TEXT, last_execution_ts TEXT)',
+    'CREATE TABLE IF NOT EXISTS builds (build_id INTEGER PRIMARY KEY, plan_id INTEGER, name TEXT, path TEXT, '
+    'is_open INTEGER, synced INTEGER DEFAULT 0, release_date TEXT)',
+    'CREATE TABLE IF NOT EXISTS test_cases (tc_id INTEGER, version INTEGER, external_id TEXT, name TEXT, '
+    'importance TEXT, creation_ts TEXT, PRIMARY KEY (tc_id, version))',
+    'CREATE TABLE IF NOT EXISTS plan_test_cases (plan_id INTEGER, tc_id INTEGER, version INTEGER, '
+    'PRIMARY KEY (plan_id, tc_id))',
+    'CREATE TABLE IF NOT EXISTS executions (execution_id INTEGER PRIMARY KEY, plan_id INTEGER, build_id INTEGER, '
+    'tc_id INTEGER, status TEXT, execution_ts TEXT, ts_estimated INTEGER DEFAULT 0)',
+    'CREATE INDEX IF NOT EXISTS builds_plan_path ON builds (plan_id, path)',
+    'CREATE INDEX IF NOT EXISTS executions_plan_test ON executions (plan_id, tc_id, execution_ts)',
+    'CREATE INDEX IF NOT EXISTS executions_build ON executions (build_id, status)',
+]
+
+
+class TestLinkWarehouse(object):
+    """
+    Local copy of the testlink execution history of a project which is kept up to date with sync()
+    """
+
+    def __init__(self, database_path, session=None):
+        """ Initiator, creates the tables if the database is new
+
+        database_path: (string)          Path of the SQLite database file (':memory:' for a database which is not kept)
+        session:       (TestLinkSession) Session used to sync from the testlink server, only needed to call sync()
+        """
+        self._session = session
+        self._connection = sqlite3.connect(database_path)
+        with self._connection:
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+
+    def close(self):
+        """ Closes the database """
+        self._connection.close()
+
+    # SYNC
+    ##################
+
+    def sync(self, plan_ids=None):
+        """ Syncs the active test plans of the project (or the given plans) and returns the number of new executions """
+        plans = self._session.get_test_plans()
+        if plan_ids is not None:
+            plan_ids = set(str(plan_id) for plan_id in plan_ids)
+            plans = [plan for plan in plans if str(plan['id']) in plan_ids]
+
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO plans (plan_id, name, active, last_sync_ts, last_execution_ts) '
+                                         'VALUES (?, ?, ?, (SELECT last_sync_ts FROM plans WHERE plan_id = ?), '
+                                         '(SELECT last_execution_ts FROM plans WHERE plan_id = ?))',
+                                         [(plan['id'], plan['name'], plan['active'], plan['id'], plan['id']) for plan in plans])
+        return sum(self.sync_plan(plan['id']) for plan in plans)
+
+    def sync_plan(self, plan_id):
+        """
+        Syncs the builds, test cases and executions of a test plan and returns the number of new executions
+
+        Only builds which are new or still open are fetched, the results of each build are fetched concurrently
+        and also added to the session's execution index so it does not fetch them again
+        The timestamp of a new execution is taken from the test's last execution result (fetched concurrently),
+        executions which are not the last of their test are given an estimated timestamp
+        """
+        plan_id = int(plan_id)
+        sync_ts = datetime.now().strftime(EXECUTION_TS_FORMAT)
+        builds = self._session.get_build_info_from_plan(plan_id)
+        synced_builds = dict((row[0], row[1]) for row in self._connection.execute(
+            'SELECT build_id, is_open FROM builds WHERE plan_id = ? AND synced = 1', (plan_id,)))
+        closed_builds = set(build_id for build_id, is_open in synced_builds.items() if not is_open)
+        builds_to_sync = [build for build in builds if int(build['id']) not in closed_builds]
+
+        test_cases = [filter_test_case_info(details) + (details['version'],)
+                      for details in self._session.get_test_case_details_from_plan(plan_id).values()]
+
+        build_results = self._session.get_build_results(plan_id, builds_to_sync)
+        self._session.execution_index.add_build_results(plan_id, build_results)
+        executions = {}
+        for build, testcases in build_results:
+            for testcase in testcases:
+                if testcase['exec_status'] != 'n' and testcase.get('exec_id'):
+                    executions[int(testcase['exec_id'])] = [plan_id, int(build['id']), int(testcase['tcase_id']),
+                                                            testcase['exec_status'], testcase.get('execution_ts'), 0]
+
+        known_executions = self._get_known_executions(plan_id, executions)
+        new_executions = dict((execution_id, execution) for execution_id, execution in executions.items()
+                              if execution_id not in known_executions)
+        self._add_execution_timestamps(plan_id, new_executions)
+        self._add_estimated_timestamps(new_executions, builds_to_sync, synced_builds, sync_ts)
+
+        with self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO plans (plan_id) VALUES (?)', (plan_id,))
+            self._connection.executemany('INSERT OR REPLACE INTO builds '
+                                         '(build_id, plan_id, name, path, is_open, synced, release_date) '
+                                         'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                         [(build['id'], plan_id, build['name'], get_upgrade_path_from_build(build['name']),
+                                           int(build.get('is_open', 0)), 1, build.get('release_date') or None)
+                                          for build in builds_to_sync])
+            self._connection.executemany('INSERT OR REPLACE INTO test_cases '
+                                         '(tc_id, external_id, name, importance, creation_ts, version) '
+                                         'VALUES (?, ?, ?, ?, ?, ?)',
+                                         [(tc_id, info['id'], info['name'], info['importance'], info['creation_ts'], version)
+                                          for tc_id, info, version in test_cases])
+            self._connection.execute('DELETE FROM plan_test_cases WHERE plan_id = ?', (plan_id,))
+            self._connection.executemany('INSERT INTO plan_test_cases (plan_id, tc_id, version) VALUES (?, ?, ?)',
+                                         [(plan_id, tc_id, version) for tc_id, _, version in test_cases])
+            self._connection.executemany('INSERT INTO executions '
+                                         '(execution_id, plan_id, build_id, tc_id, status, execution_ts, ts_estimated) '
+                                         'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                         [[execution_id] + execution for execution_id, execution in new_executions.items()])
+            self._connection.execute('UPDATE plans SET last_sync_ts = ?, last_execution_ts = '
+                                     '(SELECT MAX(execution_ts) FROM executions WHERE plan_id = ? AND ts_estimated = 0) '
+                                     'WHERE plan_id = ?', (sync_ts, plan_id, plan_id))
+        return len(new_executions)
+
+    def _get_known_executions(self, plan_id, executions):
+        """ Returns the set of execution ids which are already in the database """
+        known = set()
+        execution_ids = list(executions)
+        # stay under the SQLite limit on the number of parameters in one statement
+        for start in range(0, len(execution_ids), 500):
+            chunk = execution_ids[start:start + 500]
+            known.update(row[0] for row in self._connection.execute(
+                'SELECT execution_id FROM executions WHERE plan_id = ? AND execution_id IN (%s)' % ','.join('?' * len(chunk)),
+                [plan_id] + chunk))
+        return known
+
+    def _add_execution_timestamps(self, plan_id, executions):
+        """ Fills in the timestamp of the new executions which the build results did not include """
+        missing = dict((execution[2], execution_id) for execution_id, execution in executions.items() if not execution[4])
+        if not missing:
+            return
+
+        last_executions = self._session.get_last_execution_info_for_tests(plan_id, missing.keys())
+        for tc_id, last_execution in last_executions.items():
+            execution_id = int(last_execution['id'])
+            if execution_id in executions:
+                executions[execution_id][4] = last_execution['execution_ts']
+
+    @staticmethod
+    def _add_estimated_timestamps(executions, builds, synced_builds, sync_ts):
+        """
+        Gives the new executions which still have no timestamp an estimated one (and sets their ts_estimated flag)
+        An execution on a build which was synced before is given the time of this sync (it was run since the last one),
+        an execution on a build which is new to the database is given the build's release date if testlink has one
+        """
+        release_dates = dict((int(build['id']), build.get('release_date')) for build in builds)
+        for execution in executions.values():
+            if execution[4]:
+                continue
+            release_date = release_dates.get(execution[1])
+            if execution[1] not in synced_builds and release_date:
+                execution[4] = '%s 00:00:00' % release_date[:10]
+            else:
+                execution[4] = sync_ts
+            execution[5] = 1
+
+    # QUERIES
+    ##################
+
+    def get_last_execution_ts(self, plan_id):
+        """ Returns the timestamp of the most recent execution of a plan in the database, None if it has no executions """
+        row = self._connection.execute('SELECT last_execution_ts FROM plans WHERE plan_id = ?', (plan_id,)).fetchone()
+        return row[0] if row else None
+
+    def find_not_run_for_n_days(self, plan_id, num_days=-1):
+        """
+        Returns a dictionary of tests not run for num_days days for a test plan based on test priority
+        Setting num_days to -1 effectly sets num_days to infinity (ie only checks if a test was run)
+        Same result as TestLinkSession.find_not_run_for_n_days from the data in the database,
+        only the timestamps reported by testlink are used (not the estimated ones)
+        """
+        curr_time = datetime.now()
+        not_run_tests = {'HIGH': [], 'MEDIUM': [], 'LOW': []}
+        rows = self._connection.execute('SELECT tc.external_id, tc.name, tc.importance, COUNT(e.execution_id), '
+                                        'MAX(CASE WHEN e.ts_estimated = 0 THEN e.execution_ts END) FROM plan_test_cases p '
+                                        'JOIN test_cases tc ON tc.tc_id = p.tc_id AND tc.version = p.version '
+                                        'LEFT JOIN executions e ON e.plan_id = p.plan_id AND e.tc_id = p.tc_id '
+                                        'WHERE p.plan_id = ? GROUP BY p.tc_id', (plan_id,))
+
+        for external_id, name, importance, num_executions, last_execution_ts in rows:
+            if num_executions:
+                if num_days == -1:
+                    continue
+                if last_execution_ts is not None:
+                    last_execution_date = datetime.strptime(last_execution_ts, EXECUTION_TS_FORMAT)
+                    if (curr_time - last_execution_date).days <= num_days:
+                        continue
+            not_run_tests[importance].append((external_id, name))
+        return not_run_tests
+
+    def get_path_trend(self, plan_id, num_days=None):
+        """
+        Returns the number of executions which passed, failed and were blocked on each upgrade path per day
+        {path: [(day, passed, failed, blocked), ...]} with the days in order, limited to the last num_days if given
+        Executions which had already been superseded by a later execution of the test when they were synced are counted
+        on the day of their estimated timestamp
+        """
+        query = ('SELECT b.path, substr(e.execution_ts, 1, 10) AS day, SUM(e.status = \'p\'), SUM(e.status = \'f\'), '
+                 'SUM(e.status = \'b\') FROM executions e JOIN builds b ON b.build_id = e.build_id '
+                 'WHERE e.plan_id = ?')
+        args = [plan_id]
+        if num_days is not None:
+            query += ' AND e.execution_ts >= ?'
+            args.append((datetime.now() - timedelta(days=num_days)).strftime(EXECUTION_TS_FORMAT))
+        query += ' GROUP BY b.path, day ORDER BY b.path, day'
+
+        trend = {}
+        for path, day, passed, failed, blocked in self._connection.execute(query, args):
+            trend.setdefault(path, []).append((day, passed, failed, blocked))
+        return trend
+
+    def get_path_counts(self, plan_id):
+        """ Returns the number of executions which passed, failed and were blocked on each upgrade path """
+        rows = self._connection.execute('SELECT b.path, SUM(e.status = \'p\'), SUM(e.status = \'f\'), SUM(e.status = \'b\') '
+                                        'FROM executions e JOIN builds b ON b.build_id = e.build_id '
+                                        'WHERE e.plan_id = ? GROUP BY b.path', (plan_id,))
+        return dict((path, {'p': passed, 'f': failed, 'b': blocked}) for path, passed, failed, blocked in rows)
@@ -0,0 +1,191 @@
+""" Module contains utilities for coordinating threads, processes and periodic tasks from an asyncio event loop """
+
+import asyncio
+import inspect
+import logging
+
+from threading_utils import ResultList, ThreadTimeoutException, next_run_time
+
+log = logging.getLogger(__name__)
+
+_END_OF_RESULTS = object()
+
+
+async def wait_for_task(task, timeout=None):
+    """
+    Waits for a task to complete without blocking the event loop and returns task.get_result()
+    No thread is blocked while waiting so thousands of tasks can be awaited from one event loop
+
+    task:    (object) SimpleThread, RepeatingThread, TaskFuture, PeriodicTask or SimpleProcess
+    timeout: (float)  maximum number of seconds to wait, raises ThreadTimeoutException if exceeded
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def set_done(*_):
+        """ Completes the asyncio future (called in the event loop thread) """
+        if not done.done():
+            done.set_result(None)
+
+    def notify_loop(_):
+        """ Wakes the event loop (called from a worker thread), does nothing if the loop closed after a timeout """
+        try:
+            loop.call_soon_threadsafe(set_done)
+        except RuntimeError:
+            log.debug('Event loop closed before task [%s] completed', getattr(task, 'name', task))
+
+    if hasattr(task, 'add_done_callback'):
+        # threads and pools call the callback from a worker thread
+        task.add_done_callback(notify_loop)
+        file_descriptor = None
+    else:
+        # processes signal completion by making the result pipe readable
+        file_descriptor = task.fileno()
+        loop.add_reader(file_descriptor, set_done)
+
+    try:
+        await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        raise ThreadTimeoutException('Task did not complete within [%s] seconds' % timeout)
+    finally:
+        if file_descriptor is not None:
+            loop.remove_reader(file_descriptor)
+
+    return task.get_result()
+
+
+class AsyncResultStream(object):
+    """
+    Result policy for a RepeatingThread or PeriodicTask which passes each result to the event loop as it is produced
+    Iterate over the results with async for, iteration ends once the watched thread or task completes
+
+    stream = AsyncResultStream()
+    thread = stream.watch(RepeatingThread('poll', poll_counters, increment=1, results=stream))
+    thread.start()
+    async for counters in stream:
+        ...
+
+    Must be created in the event loop thread
+    """
+
+    def __init__(self):
+        """ Initiator """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def add(self, result):
+        """ Passes the result of one run to the event loop (called from the thread running the function) """
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, result)
+
+    def get(self):
+        """ Returns an empty list as the results are delivered through async iteration """
+        return []
+
+    def close(self):
+        """ Ends the async iteration once the results already added have been consumed """
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, _END_OF_RESULTS)
+        except RuntimeError:
+            log.info('Event loop closed before the result stream was closed')
+
+    def watch(self, task):
+        """ Closes the stream when the task (SimpleThread, RepeatingThread or PeriodicTask) completes, returns the task """
+        task.add_done_callback(lambda _: self.close())
+        return task
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        result = await self._queue.get()
+        if result is _END_OF_RESULTS:
+            # leave the marker on the queue so iterating again also ends straight away
+            self._queue.put_nowait(_END_OF_RESULTS)
+            raise StopAsyncIteration
+        return result
+
+
+class AsyncPeriodicTask(object):
+    """
+    Runs a function periodically on the event loop, the function can be a coroutine function or a normal function
+    This is the asyncio equivalent of PeriodicTask and has the same get_result contract
+    Normal functions run in the event loop thread so they must not block
+    """
+
+    def __init__(self, target, increment, args=None, kwargs=None, fixed_rate=True, max_runs=None, results=None,
+                 name=None):
+        """ Initiator
+
+        target:     (function)    The function (or coroutine function) to be run periodically
+        increment:  (float)       Number of seconds between runs of the function
+        args:       (list)        list of arguments to be passed to the function
+        kwargs:     (dictionary)  dictionary of arguments to be passed to the function
+        fixed_rate: (bool)        Run every increment seconds regardless of runtime, otherwise increment seconds apart
+        max_runs:   (int)         The task completes after the function has run this many times
+        results:    (object)      Result policy, every result is kept in a ResultList if not given
+        name:       (string)      The name of the task, used for logging
+        """
+        self.name = name or getattr(target, '__name__', 'Unnamed_Task')
+        self._target = target
+        self._args = args if args is not None else ()
+        self._kwargs = kwargs if kwargs is not None else {}
+        self._increment = increment
+        self._fixed_rate = fixed_rate
+        self._max_runs = max_runs
+
+        self._results = results if results is not None else ResultList()
+        self._exception_message = None
+        self._task = None
+
+    def start(self, delay=None):
+        """ Schedules the first run after delay seconds (defaults to increment) and returns the task """
+        self._task = asyncio.ensure_future(self._run(self._increment if delay is None else delay))
+        return self
+
+    def cancel(self):
+        """ Stops the task, the function is interrupted if it is a coroutine which is currently awaiting """
+        if self._task is not None:
+            self._task.cancel()
+
+    def done(self):
+        """ Returns true if the task was cancelled, reached max_runs or raised an exception """
+        return self._task is not None and self._task.done()
+
+    async def wait(self):
+        """ Waits for the task to complete and returns get_result() """
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.get_result()
+
+    def get_result(self):
+        """
+        Returns the results of the runs of the target function (see RepeatingThread.get_result)
+        whether an exception was thrown and the thrown exception
+
+        If no exception was thrown then the exception message will be None
+        """
+        return self._results.get(), self._exception_message is not None, self._exception_message
+
+    async def _run(self, delay):
+        """ Runs the function every increment seconds until cancelled, max_runs is reached or an exception is raised """
+        loop = asyncio.get_running_loop()
+        run_time = loop.time() + delay
+        num_runs = 0
+
+        while self._max_runs is None or num_runs < self._max_runs:
+            await asyncio.sleep(max(run_time - loop.time(), 0))
+
+            try:
+                result = self._target(*self._args, **self._kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                log.info('Task [%s] Exception occurred: [%s] with message: [%s]', self.name, type(e), e)
+                self._exception_message = e
+                return
+
+            self._results.add(result)
+            num_runs += 1
+            run_time = next_run_time(run_time, self._increment, self._fixed_rate)
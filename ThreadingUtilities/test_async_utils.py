@@ -0,0 +1,132 @@
+"""
+Tests for async_utils, each test runs its coroutine in a new event loop
+
+python -m unittest test_async_utils
+"""
+
+import asyncio
+import threading
+import unittest
+
+from async_utils import AsyncPeriodicTask, AsyncResultStream, wait_for_task
+from threading_utils import (PeriodicScheduler, RepeatingThread, SimpleProcess, SimpleThread, ThreadTimeoutException,
+                             WorkerPool)
+
+
+def square(value):
+    """ Module level so it can be run in a SimpleProcess """
+    return value * value
+
+
+class WaitForTaskTestCase(unittest.TestCase):
+
+    def test_each_task_type(self):
+        """ Every kind of task can be awaited and returns its get_result() """
+        pool = WorkerPool(2)
+        scheduler = PeriodicScheduler(pool=pool)
+        counter = iter(range(10))
+
+        async def wait_for_all():
+            return await asyncio.gather(
+                wait_for_task(_started(SimpleThread('thread', square, args=(2,)))),
+                wait_for_task(pool.submit(square, 3)),
+                wait_for_task(scheduler.schedule(lambda: next(counter), 0.01, max_runs=3)),
+                wait_for_task(_started(RepeatingThread('repeating', lambda: 'ran', increment=0.01, max_runs=2))),
+                wait_for_task(_started(SimpleProcess('process', square, args=(4,)))))
+
+        try:
+            results = asyncio.run(wait_for_all())
+        finally:
+            scheduler.stop()
+            pool.shutdown()
+
+        self.assertEqual(results, [(4, False, None), (9, False, None), ([0, 1, 2], False, None),
+                                   (['ran', 'ran'], False, None), (16, False, None)])
+
+    def test_timeout(self):
+        """
+        A task which does not complete in time raises ThreadTimeoutException,
+        completing after the event loop has closed does not break the worker which ran it
+        """
+        pool = WorkerPool(1)
+        release = threading.Event()
+        try:
+            future = pool.submit(release.wait, 5)
+            with self.assertRaises(ThreadTimeoutException):
+                asyncio.run(wait_for_task(future, timeout=0.1))
+
+            with self.assertNoLogs('threading_utils', 'ERROR'):
+                release.set()
+                self.assertTrue(future.join(5))
+                self.assertEqual(pool.submit(square, 5).result(5), 25)
+        finally:
+            release.set()
+            pool.shutdown()
+
+
+class AsyncResultStreamTestCase(unittest.TestCase):
+
+    def test_iteration_ends_when_thread_completes(self):
+        async def collect():
+            stream = AsyncResultStream()
+            counter = iter(range(10))
+            thread = stream.watch(RepeatingThread('poll', lambda: next(counter), increment=0.01, max_runs=3,
+                                                  results=stream))
+            thread.start()
+            results = [result async for result in stream]
+            # the stream stays ended when it is iterated again
+            return results, [result async for result in stream], thread.get_result()
+
+        results, again, thread_result = asyncio.run(collect())
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(again, [])
+        self.assertEqual(thread_result, ([], False, None))
+
+
+class AsyncPeriodicTaskTestCase(unittest.TestCase):
+
+    def test_max_runs_with_coroutine_function(self):
+        counter = iter(range(10))
+
+        async def poll():
+            await asyncio.sleep(0)
+            return next(counter)
+
+        async def run():
+            return await AsyncPeriodicTask(poll, 0.01, max_runs=3).start().wait()
+
+        self.assertEqual(asyncio.run(run()), ([0, 1, 2], False, None))
+
+    def test_cancel(self):
+        """ A cancelled task is done and keeps the results of the runs before it was cancelled """
+        async def run():
+            task = AsyncPeriodicTask(lambda: 'ran', 0.01).start(delay=0)
+            while not task.get_result()[0]:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            result = await task.wait()
+            return task.done(), result
+
+        done, (results, raised, exception) = asyncio.run(run())
+        self.assertTrue(done)
+        self.assertFalse(raised)
+        self.assertTrue(results)
+        self.assertEqual(set(results), {'ran'})
+
+    def test_exception_completes_task(self):
+        async def run():
+            return await AsyncPeriodicTask(lambda: 1 / 0, 0.01).start().wait()
+
+        results, raised, exception = asyncio.run(run())
+        self.assertEqual((results, raised), ([], True))
+        self.assertIsInstance(exception, ZeroDivisionError)
+
+
+def _started(task):
+    """ Starts a thread or process and returns it """
+    task.start()
+    return task
+
+
+if __name__ == '__main__':
+    unittest.main()
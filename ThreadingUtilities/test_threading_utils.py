@@ -0,0 +1,286 @@
+"""
+Tests for threading_utils
+
+python -m unittest test_threading_utils
+"""
+
+import threading
+import time
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from threading_utils import (SHARED_MEMORY_THRESHOLD, PeriodicScheduler, ProcessPool, RepeatingThread, RingBufferResults,
+                             RollingAggregateResults, SimpleThread, StreamingResults, TaskCancelledException, TaskFuture,
+                             TaskMetrics, WorkerPool, as_completed, next_run_time, run_in_process, run_in_thread,
+                             shared_memory, task_metrics)
+
+# created while this module is imported, before the functions which run on it are defined
+process_pool = ProcessPool(2)
+
+
+def tearDownModule():
+    process_pool.shutdown()
+
+
+@run_in_process('add_in_process')
+def add_in_process(a, b):
+    return a + b
+
+
+@run_in_process('fail_in_process')
+def fail_in_process(message):
+    raise ValueError(message)
+
+
+@run_in_process('fail_unpicklable_in_process')
+def fail_unpicklable_in_process():
+    # an exception of a class defined in a function can not be pickled
+    class LocalError(Exception):
+        pass
+    raise LocalError('local')
+
+
+@run_in_process('array_in_process')
+def array_in_process(size):
+    return numpy.arange(size, dtype='float64')
+
+
+@run_in_process(pool=process_pool)
+def add_in_pool(a, b):
+    return a + b
+
+
+@run_in_process(pool=process_pool)
+def fail_in_pool(message):
+    raise ValueError(message)
+
+
+class NextRunTimeTestCase(unittest.TestCase):
+
+    def test_zero_increment_runs_straight_away(self):
+        """ An increment of 0 with fixed_rate does not divide by zero """
+        self.assertGreaterEqual(next_run_time(0, 0, True), 0)
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_results_and_exceptions(self):
+        """ Futures return the function's result or raise its exception, get_result has the SimpleThread contract """
+        self.assertEqual([future.result(5) for future in self.pool.map(lambda value: value * 2, range(5))],
+                         [0, 2, 4, 6, 8])
+
+        future = self.pool.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result, 5)
+        result, raised, exception = future.get_result()
+        self.assertEqual((result, raised), (None, True))
+        self.assertIsInstance(exception, ZeroDivisionError)
+
+    def test_at_most_num_workers_run_at_once(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def task():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+        for future in [self.pool.submit(task) for _ in range(8)]:
+            future.result(5)
+        self.assertEqual(max(peak), 2)
+
+    def test_as_completed_yields_in_completion_order(self):
+        futures = [self.pool.submit(time.sleep, 0.2), self.pool.submit(lambda: None)]
+        self.assertEqual(list(as_completed(futures, timeout=5)), [futures[1], futures[0]])
+
+    def test_failing_callback_does_not_kill_worker(self):
+        """ A done callback which raises is logged, the worker keeps running the tasks queued after it """
+        pool = WorkerPool(1)
+        try:
+            future = pool.submit(time.sleep, 0.05)
+            future.add_done_callback(lambda future: 1 / 0)
+            called = []
+            future.add_done_callback(called.append)
+            self.assertEqual(pool.submit(lambda: 'next').result(5), 'next')
+            self.assertEqual(called, [future])
+        finally:
+            pool.shutdown()
+
+    def test_cancel_and_shutdown_cancel_pending(self):
+        """ Futures which have not started can be cancelled, shutdown can cancel every function still queued """
+        pool = WorkerPool(1)
+        started = threading.Event()
+        release = threading.Event()
+        running = pool.submit(lambda: (started.set(), release.wait(5)))
+        queued = [pool.submit(lambda: 'queued') for _ in range(3)]
+        self.assertTrue(started.wait(5))
+
+        self.assertFalse(running.cancel())
+        self.assertTrue(queued[0].cancel())
+        self.assertTrue(queued[0].cancelled())
+        self.assertRaises(TaskCancelledException, queued[0].result, 1)
+
+        release.set()
+        pool.shutdown(cancel_pending=True)
+        self.assertTrue(running.done())
+        self.assertFalse(running.cancelled())
+        self.assertTrue(all(future.cancelled() for future in queued))
+        self.assertRaises(RuntimeError, pool.submit, lambda: None)
+
+    def test_run_in_thread_with_pool(self):
+        """ A function decorated with a pool returns a TaskFuture from the pool """
+        @run_in_thread(pool=self.pool)
+        def double(value):
+            return value * 2
+
+        future = double(4)
+        self.assertIsInstance(future, TaskFuture)
+        self.assertTrue(future.join(5))
+        self.assertEqual(future.get_result(), (8, False, None))
+
+
+class ResultPolicyTestCase(unittest.TestCase):
+
+    def _run_thread(self, target, results, max_runs=5):
+        """ Runs target max_runs times on a RepeatingThread with the result policy and returns get_result() """
+        thread = RepeatingThread('results', target, increment=0, max_runs=max_runs, results=results)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        return thread.get_result()
+
+    def test_ring_buffer_keeps_most_recent(self):
+        counter = iter(range(10))
+        self.assertEqual(self._run_thread(lambda: next(counter), RingBufferResults(3)), ([2, 3, 4], False, None))
+
+    def test_streaming_delivers_each_result(self):
+        """ Results go to the consumer as they are produced, get_result() returns an empty list of results """
+        counter = iter(range(10))
+        delivered = []
+        self.assertEqual(self._run_thread(lambda: next(counter), StreamingResults(delivered.append)), ([], False, None))
+        self.assertEqual(delivered, [0, 1, 2, 3, 4])
+
+    def test_rolling_aggregate_kept_when_target_raises(self):
+        """ The aggregates of the runs before an exception are returned along with the exception """
+        values = iter([4, 1, 7, None])
+        results, raised, exception = self._run_thread(lambda: next(values) + 0, RollingAggregateResults())
+
+        self.assertEqual(results, {'count': 3, 'min': 1, 'max': 7, 'mean': 4.0})
+        self.assertTrue(raised)
+        self.assertIsInstance(exception, TypeError)
+
+
+class PeriodicSchedulerTestCase(unittest.TestCase):
+
+    def test_zero_increment_task(self):
+        """ A task with an increment of 0 runs back to back without stopping the other tasks """
+        with PeriodicScheduler() as scheduler:
+            zero = scheduler.schedule(lambda: 0, 0, max_runs=5)
+            other = scheduler.schedule(lambda: 1, 0.01, max_runs=3)
+            self.assertTrue(zero.join(5))
+            self.assertTrue(other.join(5))
+            self.assertEqual(zero.get_result(), ([0] * 5, False, None))
+            self.assertEqual(other.get_result(), ([1] * 3, False, None))
+
+    def test_negative_increment_rejected(self):
+        with PeriodicScheduler() as scheduler:
+            self.assertRaises(ValueError, scheduler.schedule, lambda: 0, -1)
+
+    def test_pool_shutdown_completes_task_but_not_scheduler(self):
+        """ A task which can not be submitted to its pool completes with the error, the timer thread keeps running """
+        pool = WorkerPool(2)
+        with PeriodicScheduler(pool=pool) as scheduler:
+            pool.shutdown()
+            task = scheduler.schedule(lambda: 0, 0.01)
+            self.assertTrue(task.join(5))
+            self.assertTrue(task.get_result()[1])
+            self.assertIsInstance(task.get_result()[2], RuntimeError)
+            self.assertTrue(scheduler._thread.is_alive())
+
+
+class TaskMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        task_metrics.reset()
+
+    def test_buffers_of_ended_threads_are_retired(self):
+        """ Metrics of threads which have ended are kept in one total rather than a buffer per thread """
+        for _ in range(50):
+            thread = SimpleThread('metrics_test', lambda: None)
+            thread.start()
+            thread.join()
+
+        snapshot = task_metrics.snapshot()
+        self.assertEqual(snapshot['tasks']['metrics_test']['success'], 50)
+        self.assertLessEqual(len(task_metrics._buffers), 1)
+
+    def test_live_thread_buffers_are_merged(self):
+        """ Metrics recorded by a thread which is still running are included in the snapshot """
+        metrics = TaskMetrics()
+        metrics.call('live', None, lambda: None)
+        self.assertRaises(ZeroDivisionError, metrics.call, 'live', None, lambda: 1 / 0)
+        task = metrics.snapshot()['tasks']['live']
+        self.assertEqual((task['success'], task['failure']), (1, 1))
+
+
+class ProcessTestCase(unittest.TestCase):
+
+    def test_result_and_exception_returned(self):
+        """ The result or exception of the function is sent back from the child process """
+        process = add_in_process(1, 2)
+        process.join(10)
+        self.assertEqual(process.get_result(), (3, False, None))
+
+        process = fail_in_process('bad value')
+        process.join(10)
+        result, raised, exception = process.get_result()
+        self.assertIsNone(result)
+        self.assertTrue(raised)
+        self.assertIsInstance(exception, ValueError)
+        self.assertEqual(str(exception), 'bad value')
+
+    def test_unpicklable_exception_replaced(self):
+        """ An exception which can not be pickled is returned as an Exception with the same message """
+        process = fail_unpicklable_in_process()
+        process.join(10)
+        result, raised, exception = process.get_result()
+        self.assertTrue(raised)
+        self.assertIs(type(exception), Exception)
+        self.assertEqual(str(exception), 'LocalError: local')
+
+    @unittest.skipIf(numpy is None or shared_memory is None, 'needs numpy and multiprocessing.shared_memory')
+    def test_large_array_returned_through_shared_memory(self):
+        """ A numpy array larger than SHARED_MEMORY_THRESHOLD is copied back intact """
+        size = SHARED_MEMORY_THRESHOLD // 8 * 2
+        process = array_in_process(size)
+        process.join(10)
+        result, raised, _ = process.get_result()
+        self.assertFalse(raised)
+        self.assertTrue(numpy.array_equal(result, numpy.arange(size, dtype='float64')))
+
+    def test_pool_created_before_functions(self):
+        """ Functions decorated with a pool which was created earlier in the same module run on the pool """
+        future = add_in_pool(2, 3)
+        self.assertIsInstance(future, TaskFuture)
+        self.assertEqual(future.result(10), 5)
+
+        future = fail_in_pool('bad value')
+        self.assertTrue(future.join(10))
+        self.assertIsInstance(future.get_result()[2], ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,22 +1,51 @@
 """ Module contains utilities for running tests in threads """
 
+import heapq
+import importlib
+import itertools
 import logging
+import multiprocessing
+import pickle
+import sys
 import threading
 import time
 import os
 
+from collections import deque
 from functools import wraps
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
 log = logging.getLogger(__name__)
 
+DEFAULT_POOL_SIZE = 16
+
+# numpy results returned from a process larger than this many bytes are passed back through shared memory
+SHARED_MEMORY_THRESHOLD = 1024 * 1024
+
+# monotonic clock is not affected by changes to the system time (not available in python 2)
+_monotonic = getattr(time, 'monotonic', time.time)
+
 
-def run_in_thread(thread_name="Unnamed_Thread"):
+def run_in_thread(thread_name="Unnamed_Thread", pool=None):
     """
     This decorator starts a function in a new thread and returns the thread
     Use join method to wait for the function in the thread to complete
     Use get_result method to get the return value of the function
 
-    thread_name: (string) name of the thread (used when logging)
+    If a WorkerPool is given the function is submitted to the pool instead and a TaskFuture is returned,
+    the TaskFuture also has join and get_result methods so callers do not need to change
+
+    thread_name: (string)     name of the thread (used when logging)
+    pool:        (WorkerPool) pool to run the function on rather than starting a new thread
     """
 
     def decorator(func):
@@ -25,6 +54,8 @@ def run_in_thread(thread_name="Unnamed_Thread"):
         @wraps(func)
         def inner(*args, **kwargs):
             """ Inner decorator doc-string """
+            if pool is not None:
+                return pool.submit(func, *args, **kwargs)
             thread = SimpleThread(thread_name, func, args, kwargs)
             thread.start()
             return thread
@@ -33,6 +64,520 @@ def run_in_thread(thread_name="Unnamed_Thread"):
     return decorator
 
 
+def run_in_process(process_name="Unnamed_Process", pool=None):
+    """
+    This decorator starts a function in a new process and returns the process, use this for CPU bound functions
+    Use join method to wait for the function in the process to complete
+    Use get_result method to get the return value of the function (same contract as run_in_thread)
+
+    If a ProcessPool is given the function is submitted to the pool instead and a TaskFuture is returned
+    The decorated function must be defined at the top level of a module and its arguments and result must be picklable
+
+    process_name: (string)      name of the process (used when logging)
+    pool:         (ProcessPool) pool to run the function on rather than starting a new process
+    """
+
+    def decorator(func):
+        """ Outer decorator doc-string """
+        target = _TargetReference(func.__module__, func.__name__)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            """ Inner decorator doc-string """
+            if pool is not None:
+                return pool.submit(target, *args, **kwargs)
+            process = SimpleProcess(process_name, target, args, kwargs)
+            process.start()
+            return process
+
+        inner._process_target = func
+        return inner
+    return decorator
+
+
+def next_run_time(scheduled_time, increment, fixed_rate):
+    """
+    Returns the time of the next run of a periodic function which was scheduled to run at scheduled_time
+
+    With fixed_rate runs stay on the grid scheduled_time + n * increment (runs which were missed are skipped)
+    Otherwise there is a gap of increment seconds between the end of one run and the start of the next
+    An increment of 0 has no grid so the next run is always straight away
+    """
+    now = _monotonic()
+    if not fixed_rate or increment == 0:
+        return now + increment
+    next_time = scheduled_time + increment
+    if next_time <= now:
+        next_time += increment * (int((now - next_time) // increment) + 1)
+    return next_time
+
+
+class ResultList(object):
+    """ Result policy which keeps every result in a list (default, memory grows with the number of runs) """
+
+    def __init__(self):
+        """ Initiator """
+        self._results = list()
+
+    def add(self, result):
+        """ Stores the result of one run """
+        self._results.append(result)
+
+    def get(self):
+        """ Returns a list of all the results """
+        return self._results
+
+
+class RingBufferResults(object):
+    """ Result policy which keeps only the most recent capacity results """
+
+    def __init__(self, capacity):
+        """ Initiator
+
+        capacity: (int) The maximum number of results kept, older results are discarded
+        """
+        self._results = deque(maxlen=capacity)
+
+    def add(self, result):
+        """ Stores the result of one run, discarding the oldest result if the buffer is full """
+        self._results.append(result)
+
+    def get(self):
+        """ Returns a list of the kept results, oldest first """
+        return list(self._results)
+
+
+class StreamingResults(object):
+    """ Result policy which passes each result to a consumer as it is produced and keeps nothing """
+
+    def __init__(self, consumer):
+        """ Initiator
+
+        consumer: (function or queue) called with each result, or a queue each result is put on
+        """
+        self._deliver = consumer.put if hasattr(consumer, 'put') else consumer
+
+    def add(self, result):
+        """ Delivers the result of one run to the consumer """
+        self._deliver(result)
+
+    def get(self):
+        """ Returns an empty list as the results have already been delivered to the consumer """
+        return []
+
+
+class RollingAggregateResults(object):
+    """ Result policy which keeps the count, min, max and mean of numeric results in constant memory """
+
+    def __init__(self):
+        """ Initiator """
+        self._lock = threading.Lock()
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    def add(self, result):
+        """ Updates the aggregates with the result of one run """
+        with self._lock:
+            self._count += 1
+            self._total += result
+            self._min = result if self._min is None else min(self._min, result)
+            self._max = result if self._max is None else max(self._max, result)
+
+    def get(self):
+        """ Returns a dictionary with the count, min, max and mean of the results (None if there are no results) """
+        with self._lock:
+            return {'count': self._count,
+                    'min': self._min,
+                    'max': self._max,
+                    'mean': float(self._total) / self._count if self._count else None}
+
+
+class TaskMetrics(object):
+    """
+    Collects the queue wait time, run time and success/failure counts of tasks plus the concurrency high water mark
+
+    Each thread records into its own buffer so no lock is taken when a task completes,
+    the buffers are only merged when snapshot() or export_prometheus() is called
+    The buffers of threads which have ended are folded into a shared total so memory does not grow with every
+    new thread (run_in_thread starts a thread per call)
+    The active task count and high water mark use atomic counters rather than a lock so they are approximate
+    """
+
+    def __init__(self):
+        """ Initiator """
+        self.enabled = True
+        self._register_lock = threading.Lock()
+        self._local = threading.local()
+        # (thread, buffer) for each live thread which has recorded metrics
+        self._buffers = []
+        # metrics of the threads which have ended
+        self._retired = {}
+
+        self._num_started = itertools.count(1)
+        self._num_finished = itertools.count(1)
+        self._started = 0
+        self._finished = 0
+        self._high_water_mark = 0
+
+    def call(self, name, queued_time, target, args=(), kwargs=None):
+        """ Runs target and records its metrics under name, exceptions raised by target are re-raised
+
+        name:        (string)   The name the metrics are recorded under (i.e. the thread or function name)
+        queued_time: (float)    _monotonic() time the task was queued or scheduled, None if it was not queued
+        target:      (function) The function to be run
+        """
+        kwargs = kwargs if kwargs is not None else {}
+        if not self.enabled:
+            return target(*args, **kwargs)
+
+        self._started = next(self._num_started)
+        active = self._started - self._finished
+        if active > self._high_water_mark:
+            self._high_water_mark = active
+
+        start_time = _monotonic()
+        succeeded = False
+        try:
+            result = target(*args, **kwargs)
+            succeeded = True
+            return result
+        finally:
+            end_time = _monotonic()
+            self._finished = next(self._num_finished)
+            self._record(name, start_time - queued_time if queued_time is not None else 0.0,
+                         end_time - start_time, succeeded)
+
+    def snapshot(self):
+        """ Returns a dictionary with the concurrency metrics and a dictionary of metrics for each task name """
+        with self._register_lock:
+            self._retire_buffers()
+            buffers = [self._retired] + [buffer for _, buffer in self._buffers]
+            buffers = [dict((name, list(stats)) for name, stats in buffer.copy().items()) for buffer in buffers]
+
+        tasks = {}
+        for buffer in buffers:
+            for name, (successes, failures, wait_total, wait_max, run_total, run_max) in buffer.items():
+                task = tasks.setdefault(name, {'success': 0, 'failure': 0,
+                                               'queue_wait_total': 0.0, 'queue_wait_max': 0.0,
+                                               'run_time_total': 0.0, 'run_time_max': 0.0})
+                task['success'] += successes
+                task['failure'] += failures
+                task['queue_wait_total'] += wait_total
+                task['queue_wait_max'] = max(task['queue_wait_max'], wait_max)
+                task['run_time_total'] += run_total
+                task['run_time_max'] = max(task['run_time_max'], run_max)
+
+        return {'active': self._active(),
+                'high_water_mark': self._high_water_mark,
+                'tasks': tasks}
+
+    def export_prometheus(self, file_name=None):
+        """ Returns the metrics in the prometheus text format, the text is also written to file_name if given
+
+        The file is written to a temporary file and renamed so a collector never reads a partial file
+        """
+        snapshot = self.snapshot()
+        lines = ['# TYPE threading_utils_active_tasks gauge',
+                 'threading_utils_active_tasks %d' % snapshot['active'],
+                 '# TYPE threading_utils_concurrency_high_water_mark gauge',
+                 'threading_utils_concurrency_high_water_mark %d' % snapshot['high_water_mark']]
+
+        tasks = [('task="%s"' % str(name).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'), task)
+                 for name, task in sorted(snapshot['tasks'].items())]
+
+        lines.append('# TYPE threading_utils_task_runs_total counter')
+        for label, task in tasks:
+            lines.append('threading_utils_task_runs_total{%s,outcome="success"} %d' % (label, task['success']))
+            lines.append('threading_utils_task_runs_total{%s,outcome="failure"} %d' % (label, task['failure']))
+
+        metrics = [('task_queue_wait_seconds_total', 'counter', 'queue_wait_total'),
+                   ('task_queue_wait_seconds_max', 'gauge', 'queue_wait_max'),
+                   ('task_run_seconds_total', 'counter', 'run_time_total'),
+                   ('task_run_seconds_max', 'gauge', 'run_time_max')]
+        for metric, metric_type, key in metrics:
+            lines.append('# TYPE threading_utils_%s %s' % (metric, metric_type))
+            for label, task in tasks:
+                lines.append('threading_utils_%s{%s} %f' % (metric, label, task[key]))
+        text = '\n'.join(lines) + '\n'
+
+        if file_name is not None:
+            temp_file_name = '%s.%d.tmp' % (file_name, os.getpid())
+            with open(temp_file_name, 'w') as metrics_file:
+                metrics_file.write(text)
+            os.rename(temp_file_name, file_name)
+        return text
+
+    def reset(self):
+        """ Discards all recorded task metrics, the high water mark is reset to the number of active tasks """
+        with self._register_lock:
+            self._local = threading.local()
+            self._buffers = []
+            self._retired = {}
+        self._high_water_mark = self._active()
+
+    def _active(self):
+        """ Returns the approximate number of tasks currently running """
+        return max(self._started - self._finished, 0)
+
+    def _record(self, name, queue_wait, run_time, succeeded):
+        """ Adds the metrics of one task run to the calling thread's buffer """
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = {}
+            with self._register_lock:
+                self._retire_buffers()
+                self._buffers.append((threading.current_thread(), buffer))
+
+        stats = buffer.get(name)
+        if stats is None:
+            stats = buffer[name] = [0, 0, 0.0, 0.0, 0.0, 0.0]
+        if succeeded:
+            stats[0] += 1
+        else:
+            stats[1] += 1
+        stats[2] += queue_wait
+        stats[3] = max(stats[3], queue_wait)
+        stats[4] += run_time
+        stats[5] = max(stats[5], run_time)
+
+    def _retire_buffers(self):
+        """ Adds the buffers of threads which have ended to the retired total and drops them (register lock is held) """
+        live_buffers = []
+        for thread, buffer in self._buffers:
+            if thread.is_alive():
+                live_buffers.append((thread, buffer))
+                continue
+            for name, (successes, failures, wait_total, wait_max, run_total, run_max) in buffer.items():
+                stats = self._retired.setdefault(name, [0, 0, 0.0, 0.0, 0.0, 0.0])
+                stats[0] += successes
+                stats[1] += failures
+                stats[2] += wait_total
+                stats[3] = max(stats[3], wait_max)
+                stats[4] += run_total
+                stats[5] = max(stats[5], run_max)
+        self._buffers = live_buffers
+
+
+# metrics for all the threads, pools and periodic tasks in this module
+task_metrics = TaskMetrics()
+
+
+def as_completed(futures, timeout=None):
+    """
+    Generator which yields TaskFutures as they complete (or are cancelled), in completion order
+
+    futures: (list)  TaskFutures returned by WorkerPool.submit
+    timeout: (float) maximum number of seconds to wait for all the futures, raises ThreadTimeoutException if exceeded
+    """
+    futures = list(futures)
+    completed = queue.Queue()
+    for future in futures:
+        future.add_done_callback(completed.put)
+
+    end_time = None if timeout is None else time.time() + timeout
+    for _ in range(len(futures)):
+        try:
+            remaining = None if end_time is None else max(end_time - time.time(), 0)
+            yield completed.get(timeout=remaining)
+        except queue.Empty:
+            raise ThreadTimeoutException('Futures did not complete within [%s] seconds' % timeout)
+
+
+class TaskFuture(object):
+    """
+    Handle for a function submitted to a WorkerPool
+    get_result has the same contract as SimpleThread.get_result, result() returns the value or raises the exception
+    """
+
+    def __init__(self, target, args=None, kwargs=None):
+        """ Initiator
+
+        target: (function)    The function to be run by the pool
+        args:   (list)        list of arguments to be passed to the function
+        kwargs: (dictionary)  dictionary of arguments to be passed to the function
+        """
+        self._target = target
+        self._args = args if args is not None else ()
+        self._kwargs = kwargs if kwargs is not None else {}
+
+        self._lock = threading.Lock()
+        self._done_event = threading.Event()
+        self._callbacks = []
+        self._state = 'PENDING'
+        self._queued_time = _monotonic()
+        self._exception_message = None
+        self._result_message = None
+
+    def cancel(self):
+        """ Cancels the function if it has not started running, returns true if the function was cancelled """
+        with self._lock:
+            if self._state != 'PENDING':
+                return self._state == 'CANCELLED'
+            self._state = 'CANCELLED'
+        self._complete()
+        return True
+
+    def cancelled(self):
+        """ Returns true if the function was cancelled before it ran """
+        return self._state == 'CANCELLED'
+
+    def running(self):
+        """ Returns true if the function is currently running """
+        return self._state == 'RUNNING'
+
+    def done(self):
+        """ Returns true if the function has completed or was cancelled """
+        return self._done_event.is_set()
+
+    def join(self, timeout=None):
+        """ Waits for the function to complete, returns true if it completed within timeout seconds """
+        return self._done_event.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """ Calls callback with this future once it completes (immediately if it has already completed)
+        An exception raised by the callback is logged and ignored
+        """
+        with self._lock:
+            if not self._done_event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call_callback(callback)
+
+    def get_result(self):
+        """
+        Returns the result of the function, whether an exception was thrown and the thrown exception
+
+        If an exception was thrown then the result message will be None
+        If no exception was thrown then the exception message will be None
+        """
+        return self._result_message, self._exception_message is not None, self._exception_message
+
+    def result(self, timeout=None):
+        """ Waits for the function to complete and returns its result, raises the exception the function threw """
+        if not self.join(timeout):
+            raise ThreadTimeoutException('Task did not complete within [%s] seconds' % timeout)
+        if self.cancelled():
+            raise TaskCancelledException('Task was cancelled')
+        if self._exception_message is not None:
+            raise self._exception_message
+        return self._result_message
+
+    def _run(self):
+        """ Runs the function in the calling (worker) thread unless the future was cancelled """
+        with self._lock:
+            if self._state != 'PENDING':
+                return
+            self._state = 'RUNNING'
+
+        try:
+            self._result_message = task_metrics.call(getattr(self._target, '__name__', 'Unnamed_Task'),
+                                                     self._queued_time, self._target, self._args, self._kwargs)
+        except Exception as e:
+            log.info('Task Exception occurred: [%s] with message: [%s]', type(e), e)
+            self._exception_message = e
+
+        with self._lock:
+            self._state = 'FINISHED'
+        self._complete()
+
+    def _set_outcome(self, outcome):
+        """ Stores the (result, exception) returned by a function which was run in another process """
+        self._result_message, self._exception_message = outcome
+        with self._lock:
+            self._state = 'FINISHED'
+        self._complete()
+
+    def _complete(self):
+        """ Sets the done event and runs the callbacks registered with add_done_callback """
+        with self._lock:
+            self._done_event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call_callback(callback)
+
+    def _call_callback(self, callback):
+        """ Calls a done callback, an exception it raises is logged so it can not kill the worker thread """
+        try:
+            callback(self)
+        except Exception:
+            log.exception('Exception in done callback of task [%s]', getattr(self._target, '__name__', 'Unnamed_Task'))
+
+
+class WorkerPool(object):
+    """
+    A fixed number of reusable worker threads which run submitted functions
+    At most num_workers functions run at once, further functions wait in the queue until a worker is free
+    Threads are started when the pool is created and stopped by shutdown() (or leaving a with block)
+    """
+
+    def __init__(self, num_workers=DEFAULT_POOL_SIZE, name="WorkerPool"):
+        """ Initiator
+
+        num_workers: (int)    The maximum number of functions run concurrently by the pool
+        name:        (string) name of the pool, the workers are named <name>-<index> (used when logging)
+        """
+        self._name = name
+        self._queue = queue.Queue()
+        self._shutdown = False
+        self._workers = []
+
+        for index in range(num_workers):
+            worker = threading.Thread(target=self._run_worker, name='%s-%d' % (name, index))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def submit(self, target, *args, **kwargs):
+        """ Queues a function to be run by the pool and returns a TaskFuture """
+        if self._shutdown:
+            raise RuntimeError('Can not submit to pool [%s] after shutdown' % self._name)
+        future = TaskFuture(target, args, kwargs)
+        self._queue.put(future)
+        return future
+
+    def map(self, target, iterable):
+        """ Runs target on each item of iterable using the pool and returns a list of TaskFutures in the same order """
+        return [self.submit(target, item) for item in iterable]
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """ Stops the workers once the queued functions have completed
+
+        wait:           (bool) wait for the workers to finish before returning
+        cancel_pending: (bool) cancel functions which have not started rather than running them
+        """
+        self._shutdown = True
+        if cancel_pending:
+            while True:
+                try:
+                    future = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                future.cancel()
+
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _run_worker(self):
+        """ Runs functions from the queue until shutdown is called """
+        while True:
+            future = self._queue.get()
+            if future is None:
+                break
+            future._run()
+
+
 class SimpleThread(threading.Thread):
     """
     This is a simple thread class which just runs a function in a separate thread and handles
@@ -57,19 +602,51 @@ class SimpleThread(threading.Thread):
         self._exception_event = threading.Event()
         self._exception_message = None
         self._result_message = None
+        self._queued_time = None
+
+        self._callback_lock = threading.Lock()
+        self._callbacks = []
+        self._finished = False
+
+    def start(self):
+        """ Starts the thread, the time until the thread begins running is recorded as its queue wait """
+        self._queued_time = _monotonic()
+        threading.Thread.start(self)
 
     def run(self):
         """ This function is run as a new thread when start is called on the Thread object """
         try:
-            self._log_with_lock("Starting new Thread: [%s]", self._name)
-            self._result_message = self._target(*self._args, **self._kwargs)
-            self._log_with_lock("Completed Thread: [%s]", self._name)
+            self._log("Starting new Thread: [%s]", self._name)
+            self._result_message = task_metrics.call(self._name, self._queued_time,
+                                                     self._target, self._args, self._kwargs)
+            self._log("Completed Thread: [%s]", self._name)
 
         except Exception as e:
-            self._log_with_lock('Thread Exception occurred: [%s] with message: [%s]', type(e), e)
+            self._log('Thread Exception occurred: [%s] with message: [%s]', type(e), e)
             self._exception_event.set()
             self._exception_message = e
 
+        finally:
+            self._run_done_callbacks()
+
+    def add_done_callback(self, callback):
+        """ Calls callback with this thread once run() completes (immediately if it has already completed),
+        the callback is called from the thread so it should be short
+        """
+        with self._callback_lock:
+            if not self._finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _run_done_callbacks(self):
+        """ Marks the thread as finished and calls the callbacks registered with add_done_callback """
+        with self._callback_lock:
+            self._finished = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
     def get_result(self):
         """
         Returns the result of the function run by the thread,
@@ -80,31 +657,41 @@ class SimpleThread(threading.Thread):
         """
         return self._result_message, self._exception_event.is_set(), self._exception_message
 
-    def _log_with_lock(self, message, *args):
-        """ Applies a lock when printing from the thread """
-        with self._lock:
-            log.info(message, *args)
+    def _log(self, message, *args):
+        """ Logs from the thread (no lock is taken, logging handlers serialise output across threads) """
+        log.info(message, *args)
 
 
-# FIXME: Modify this so that we can also specify the number of times we want the function to be run in the thread
 class RepeatingThread(SimpleThread):
     """
     Runs a function repeatedly in a separate thread from the main program
-    Thread is stopped by a call to stop()
+    Thread is stopped by a call to stop() or after max_runs runs of the function
     When stop() is called the current run of the target function will complete before the thread terminates
     The target function should have a short runtime as the thread can not be stopped while it is running
     The get_results() returns true if all the runs of the target function where successful
+
+    Use a PeriodicScheduler rather than a RepeatingThread per function when there are many periodic functions
     """
 
-    def __init__(self, name=None, target=None, increment=1, timeout=3600, args=None, kwargs=None):
-        """ Initiator """
+    def __init__(self, name=None, target=None, increment=1, timeout=3600, args=None, kwargs=None,
+                 max_runs=None, fixed_rate=False, results=None):
+        """ Initiator
+
+        max_runs:   (int)    The thread stops after the function has run this many times (None to run until stopped)
+        fixed_rate: (bool)   Run the function every increment seconds regardless of its runtime,
+                             otherwise wait increment seconds after each run completes
+        results:    (object) Result policy (ResultList, RingBufferResults, StreamingResults or RollingAggregateResults),
+                             every result is kept in a ResultList if not given
+        """
         SimpleThread.__init__(self, name=name, target=target, args=args, kwargs=kwargs)
 
-        self._results = list()
+        self._results = results if results is not None else ResultList()
 
         self._stop_event = threading.Event()
         self._increment = increment
         self._timeout = timeout
+        self._max_runs = max_runs
+        self._fixed_rate = fixed_rate
 
     def run(self):
         """
@@ -113,49 +700,489 @@ class RepeatingThread(SimpleThread):
         Sets an exception event if an exception is thrown when running the target function
         """
         try:
-            self._log_with_lock("Starting new process with pid: [%s]", os.getpid())
+            self._log("Starting new process with pid: [%s]", os.getpid())
             start_time = time.time()
+            scheduled_time = _monotonic() + self._increment
+            num_runs = 0
 
             while not self._stop_event.is_set():
 
-                # wait increment time between runs of the target function
-                time.sleep(self._increment)
+                # wait until the next run of the target function, returns straight away if stop() is called
+                if self._stop_event.wait(max(scheduled_time - _monotonic(), 0)):
+                    break
 
-                # run the taget function and append the result to the list of results
+                # run the taget function and add the result to the result policy
                 with self._lock:
-                    self._results.append(self._target(*self._args, **self._kwargs))
+                    self._results.add(task_metrics.call(self._name, scheduled_time,
+                                                        self._target, self._args, self._kwargs))
+
+                num_runs += 1
+                if self._max_runs is not None and num_runs >= self._max_runs:
+                    self._log('Thread completed [%s] runs', num_runs)
+                    break
+                scheduled_time = next_run_time(scheduled_time, self._increment, self._fixed_rate)
 
                 # If stop was not called in time then the thread is automatically terminated
                 # This still requires completeion of the last call of the target function
                 if time.time() - start_time >= self._timeout:
-                    self._log_with_lock('Thread terminated due to timeout')
+                    self._log('Thread terminated due to timeout')
                     raise ThreadTimeoutException('Thread timed out')
 
-            self._log_with_lock('Stopped Thread %s', self.name)
+            self._log('Stopped Thread %s', self.name)
 
         except Exception as e:
-            self._log_with_lock('Thread Exception occurred: [%s] with message: [%s]', type(e), e)
+            self._log('Thread Exception occurred: [%s] with message: [%s]', type(e), e)
             self._exception_event.set()
             self._exception_message = e
 
+        finally:
+            self._run_done_callbacks()
+
     def stop(self):
         """ Stops the created thread, thread will finish current run of target function and then complete,
         should poll for the last run to complete with join(timeout=value)
+        If the thread is waiting between runs it completes straight away
         """
-        self._log_with_lock("Stopping Thread %s", self.name)
+        self._log("Stopping Thread %s", self.name)
         self._stop_event.set()
 
     def get_result(self):
         """
-        Returns a list of results of all runs of the target function
+        Returns the results of the runs of the target function (a list of all results unless a different result policy
+        was given) whether an exception was thrown and the thrown exception
+
+        If an exception was thrown then the result message will be None
+        If no exception was thrown then the exception message will be None
+        """
+        return self._results.get(), self._exception_event.is_set(), self._exception_message
+
+
+class PeriodicTask(object):
+    """
+    Handle for a function run periodically by a PeriodicScheduler
+    get_result has the same contract as RepeatingThread.get_result
+    """
+
+    def __init__(self, name, target, increment, args=None, kwargs=None, fixed_rate=True, max_runs=None, results=None):
+        """ Initiator
+
+        name:       (string)      The name of the task, used for logging
+        target:     (function)    The function to be run periodically
+        increment:  (float)       Number of seconds between runs of the function
+        args:       (list)        list of arguments to be passed to the function
+        kwargs:     (dictionary)  dictionary of arguments to be passed to the function
+        fixed_rate: (bool)        Run every increment seconds regardless of runtime, otherwise increment seconds apart
+        max_runs:   (int)         The task completes after the function has run this many times
+        results:    (object)      Result policy, every result is kept in a ResultList if not given
+        """
+        if increment < 0:
+            raise ValueError('Task [%s] increment must not be negative [%s]' % (name, increment))
+        self.name = name
+        self._target = target
+        self._args = args if args is not None else ()
+        self._kwargs = kwargs if kwargs is not None else {}
+        self._increment = increment
+        self._fixed_rate = fixed_rate
+        self._max_runs = max_runs
+
+        self._results = results if results is not None else ResultList()
+        self._num_runs = 0
+        self._done_event = threading.Event()
+        self._exception_message = None
+
+        self._callback_lock = threading.Lock()
+        self._callbacks = []
+
+    def cancel(self):
+        """ Stops the task, a run which is in progress will complete """
+        self._finish()
+
+    def done(self):
+        """ Returns true if the task was cancelled, reached max_runs or raised an exception """
+        return self._done_event.is_set()
+
+    def join(self, timeout=None):
+        """ Waits for the task to complete, returns true if it completed within timeout seconds """
+        return self._done_event.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """ Calls callback with this task once it completes (immediately if it has already completed) """
+        with self._callback_lock:
+            if not self._done_event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def get_result(self):
+        """
+        Returns the results of the runs of the target function (see RepeatingThread.get_result)
+        whether an exception was thrown and the thrown exception
+
+        If no exception was thrown then the exception message will be None
+        """
+        return self._results.get(), self._exception_message is not None, self._exception_message
+
+    def _run(self, run_time):
+        """ Runs the function once, the task completes if the function raises an exception or max_runs is reached
+
+        run_time: (float) The time the run was scheduled for, lateness is recorded as queue wait
+        """
+        try:
+            self._results.add(task_metrics.call(self.name, run_time, self._target, self._args, self._kwargs))
+        except Exception as e:
+            self._fail(e)
+            return
+
+        self._num_runs += 1
+        if self._max_runs is not None and self._num_runs >= self._max_runs:
+            self._finish()
+
+    def _fail(self, exception):
+        """ Completes the task with an exception (raised by the function or when scheduling the task) """
+        log.info('Task [%s] Exception occurred: [%s] with message: [%s]', self.name, type(exception), exception)
+        self._exception_message = exception
+        self._finish()
+
+    def _finish(self):
+        """ Sets the done event and calls the callbacks registered with add_done_callback (only the first time) """
+        with self._callback_lock:
+            if self._done_event.is_set():
+                return
+            self._done_event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class PeriodicScheduler(object):
+    """
+    Runs many periodic functions from a single timer thread
+    Tasks are kept in a heap ordered by their next run time so the timer thread only wakes when a task is due
+
+    By default tasks run on the timer thread so they should have a short runtime,
+    if a WorkerPool is given the tasks are run on the pool and the timer thread only does the scheduling
+    A task never overlaps with itself, the next run is scheduled when the current run completes
+    """
+
+    def __init__(self, name="PeriodicScheduler", pool=None):
+        """ Initiator, starts the timer thread
+
+        name: (string)     name of the timer thread (used when logging)
+        pool: (WorkerPool) pool used to run the tasks, tasks are run on the timer thread if not given
+        """
+        self._pool = pool
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run_timer, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def schedule(self, target, increment, args=None, kwargs=None, fixed_rate=True, max_runs=None,
+                 delay=None, name=None, results=None):
+        """ Schedules a function to be run every increment seconds and returns a PeriodicTask
+
+        delay: (float) Number of seconds before the first run (defaults to increment)
+        See PeriodicTask for the other arguments
+        """
+        task = PeriodicTask(name or getattr(target, '__name__', 'Unnamed_Task'), target, increment,
+                            args, kwargs, fixed_rate, max_runs, results)
+        self._push(_monotonic() + (increment if delay is None else delay), task)
+        return task
+
+    def stop(self, wait=True):
+        """ Stops the timer thread straight away (without waiting for the next task to be due), cancels all tasks """
+        with self._condition:
+            self._stopped = True
+            tasks = [task for _, _, task in self._heap]
+            self._heap = []
+            self._condition.notify()
+        for task in tasks:
+            task.cancel()
+        if wait:
+            self._thread.join()
+
+    def _push(self, run_time, task):
+        """ Adds a task to the heap and wakes the timer thread if the task is now the first one due """
+        with self._condition:
+            if self._stopped:
+                task.cancel()
+                return
+            heapq.heappush(self._heap, (run_time, next(self._counter), task))
+            if self._heap[0][2] is task:
+                self._condition.notify()
+
+    def _run_timer(self):
+        """ Waits for the next task to be due, runs it and schedules its next run until stop is called """
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > _monotonic()):
+                    self._condition.wait(self._heap[0][0] - _monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                run_time, _, task = heapq.heappop(self._heap)
+
+            if task.done():
+                continue
+            if self._pool is None:
+                self._run_task(run_time, task)
+                continue
+            try:
+                future = self._pool.submit(self._run_task, run_time, task)
+            except Exception as e:
+                # i.e. the pool was shut down, the task can not run again but the other tasks carry on
+                task._fail(e)
+                continue
+            future.add_done_callback(lambda future, task=task: future.cancelled() and
+                                     task._fail(TaskCancelledException('Run of task [%s] was cancelled' % task.name)))
+
+    def _run_task(self, run_time, task):
+        """ Runs a task once and schedules its next run, an error only completes this task (never the timer thread) """
+        try:
+            task._run(run_time)
+            if not task.done():
+                self._push(next_run_time(run_time, task._increment, task._fixed_rate), task)
+        except Exception as e:
+            task._fail(e)
+
+
+class _TargetReference(object):
+    """
+    Picklable reference to a function decorated with run_in_process
+    The decorated function can not be pickled by name as the name refers to the decorator's wrapper,
+    so the child process looks the wrapper up by name and runs the original function stored on it
+    """
+
+    def __init__(self, module_name, function_name):
+        """ Initiator """
+        self._module_name = module_name
+        self._function_name = function_name
+
+    def __call__(self, *args, **kwargs):
+        """ Runs the referenced function """
+        module = sys.modules.get(self._module_name) or importlib.import_module(self._module_name)
+        target = getattr(module, self._function_name)
+        return getattr(target, '_process_target', target)(*args, **kwargs)
+
+
+class _SharedArray(object):
+    """ Description of a numpy array which was copied to shared memory by a child process """
+
+    def __init__(self, name, shape, dtype):
+        """ Initiator """
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _to_shared_memory(result):
+    """ Copies a large numpy array to shared memory and returns its description, other results are returned unchanged """
+    if (shared_memory is None or type(result).__name__ != 'ndarray' or
+            getattr(result, 'nbytes', 0) < SHARED_MEMORY_THRESHOLD or result.dtype.hasobject):
+        return result
+
+    import numpy as np
+    shm = shared_memory.SharedMemory(create=True, size=result.nbytes)
+    try:
+        np.ndarray(result.shape, dtype=result.dtype, buffer=shm.buf)[...] = result
+    finally:
+        shm.close()
+
+    # the parent process takes ownership and unlinks the shared memory, stop the resource tracker cleaning it up
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return _SharedArray(shm.name, result.shape, result.dtype.str)
+
+
+def _from_shared_memory(result):
+    """ Copies an array out of shared memory and frees the shared memory, other results are returned unchanged """
+    if not isinstance(result, _SharedArray):
+        return result
+
+    import numpy as np
+    shm = shared_memory.SharedMemory(name=result.name)
+    try:
+        return np.ndarray(result.shape, dtype=result.dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _call_in_process(target, args, kwargs):
+    """
+    Runs a function in a child process and returns (result, exception) so both can be sent back to the parent
+    Exceptions which can not be pickled are replaced by an Exception with the same message
+    """
+    try:
+        return _to_shared_memory(target(*args, **kwargs)), None
+    except Exception as e:
+        log.info('Process Exception occurred: [%s] with message: [%s]', type(e), e)
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = Exception('%s: %s' % (type(e).__name__, e))
+        return None, e
+
+
+class SimpleProcess(multiprocessing.Process):
+    """
+    Runs a function in a separate process and sends the result or exception back to the parent process
+    This has the same interface as SimpleThread but is not limited by the GIL
+    """
+
+    def __init__(self, name, target, args=None, kwargs=None):
+        """ Initiator for the simple process object
+
+        name:   (string)      The name of the process, used for logging
+        target: (function)    The function to be run in the process, must be picklable (defined at module level)
+        args:   (list)        list of arguments to be passed to the function
+        kwargs: (dictionary)  dictionary of arguments to be passed to the function
+        """
+        multiprocessing.Process.__init__(self, name=name)
+        self._process_target = target
+        self._process_args = args if args is not None else ()
+        self._process_kwargs = kwargs if kwargs is not None else {}
+
+        self._receiver, self._sender = multiprocessing.Pipe(duplex=False)
+        self._outcome = None
+
+    def fileno(self):
+        """ Returns a file descriptor which becomes readable when the result is available (i.e. for select) """
+        return self._receiver.fileno()
+
+    def start(self):
+        """ Starts the process and closes the parent's copy of the sending end of the pipe """
+        multiprocessing.Process.start(self)
+        self._sender.close()
+
+    def run(self):
+        """ This function is run in the new process when start is called on the Process object """
+        log.info("Starting new process: [%s] with pid: [%s]", self.name, os.getpid())
+        self._sender.send(_call_in_process(self._process_target, self._process_args, self._process_kwargs))
+        log.info("Completed process: [%s]", self.name)
+
+    def join(self, timeout=None):
+        """ Waits for the process to complete, the result is received first so a large result can not block the child """
+        end_time = None if timeout is None else time.time() + timeout
+        self._receive(timeout)
+        multiprocessing.Process.join(self, None if end_time is None else max(end_time - time.time(), 0))
+
+    def get_result(self):
+        """
+        Returns the result of the function run by the process,
         whether an exception was thrown and the thrown exception
 
         If an exception was thrown then the result message will be None
         If no exception was thrown then the exception message will be None
         """
-        return self._results, self._exception_event.is_set(), self._exception_message
+        self._receive(0)
+        result, exception = self._outcome if self._outcome is not None else (None, None)
+        return result, exception is not None, exception
+
+    def _receive(self, timeout):
+        """ Receives the (result, exception) from the child process if it is available within timeout seconds """
+        if self._outcome is not None or not self._receiver.poll(timeout):
+            return
+        try:
+            result, exception = self._receiver.recv()
+            self._outcome = _from_shared_memory(result), exception
+        except EOFError:
+            self._outcome = None, ProcessExitException('Process [%s] exited without returning a result' % self.name)
+
+
+class ProcessPool(object):
+    """
+    A fixed number of reusable worker processes (multiprocessing.Pool) which run submitted functions
+    submit returns a TaskFuture like WorkerPool, functions can not be cancelled once they have been submitted
+
+    The worker processes are started by the first submit rather than when the pool is created, a pool created while
+    its module is being imported (i.e. for run_in_process(pool=...)) would otherwise fork workers which do not have
+    the functions defined after it
+    """
+
+    def __init__(self, num_workers=None):
+        """ Initiator
+
+        num_workers: (int) The number of worker processes, defaults to the number of CPUs
+        """
+        self._num_workers = num_workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def submit(self, target, *args, **kwargs):
+        """ Queues a function to be run by the pool and returns a TaskFuture, the function must be picklable """
+        pool = self._get_pool()
+        future = TaskFuture(target, args, kwargs)
+        future._state = 'RUNNING'
+
+        def on_result(outcome):
+            """ Called in the parent process when the function has completed """
+            result, exception = outcome
+            future._set_outcome((_from_shared_memory(result), exception))
+
+        def on_error(exception):
+            """ Called in the parent process if the function or its arguments could not be sent to the pool """
+            future._set_outcome((None, exception))
+
+        if sys.version_info[0] >= 3:
+            pool.apply_async(_call_in_process, (target, args, kwargs), callback=on_result, error_callback=on_error)
+        else:
+            pool.apply_async(_call_in_process, (target, args, kwargs), callback=on_result)
+        return future
+
+    def map(self, target, iterable):
+        """ Runs target on each item of iterable using the pool and returns a list of TaskFutures in the same order """
+        return [self.submit(target, item) for item in iterable]
+
+    def shutdown(self, wait=True):
+        """ Stops the worker processes once the submitted functions have completed
+
+        wait: (bool) wait for the workers to finish before returning
+        """
+        with self._lock:
+            self._shutdown = True
+            pool = self._pool
+        if pool is None:
+            return
+        pool.close()
+        if wait:
+            pool.join()
+
+    def _get_pool(self):
+        """ Returns the multiprocessing.Pool, the worker processes are started the first time it is needed """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Can not submit to a process pool after shutdown')
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self._num_workers)
+            return self._pool
 
 
 class ThreadTimeoutException(Exception):
     """ Exception class for when a thread times out """
     pass
+
+
+class TaskCancelledException(Exception):
+    """ Exception class for when the result of a cancelled task is requested """
+    pass
+
+
+class ProcessExitException(Exception):
+    """ Exception class for when a process exits without returning a result """
+    pass